@@ -3,12 +3,27 @@ import json
 import io
 import uuid
 import pathlib
+import re
+import sqlite3
 import time
+import hashlib
+import threading
+import tracemalloc
+import copy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from dotenv import load_dotenv
 from openai import OpenAI
-from tools_sql import get_schema, run_sql
+from singleflight import SingleFlight
+from llm_scheduler import LLMScheduler, estimate_tokens
+from tools_sql import (
+    get_schema, run_sql, run_sql_approx, table_versions, sql_tables, result_digest,
+    low_cardinality_values, stats_prompt,
+)
+from question_precision import assess_question
+import history_index
 
 # ========= Memoria (helpers) =========
 SESS_DIR = pathlib.Path("./.session")
@@ -16,6 +31,9 @@ SESS_DIR.mkdir(exist_ok=True)
 
 
 def _session_path(session_id: str):
+    # el id llega de clientes HTTP: nada de separadores ni "..", siempre dentro de SESS_DIR
+    if not session_id or not re.fullmatch(r"[\w-]{1,64}", session_id, re.ASCII):
+        raise ValueError(f"session_id inválido: {session_id!r}")
     return SESS_DIR / f"{session_id}.json"
 
 
@@ -27,8 +45,33 @@ def load_session(session_id: str) -> list:
 
 
 def save_session(session_id: str, history: list):
-    _session_path(session_id).write_text(
-        json.dumps(history, ensure_ascii=False, indent=2))
+    p = _session_path(session_id)
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(history, ensure_ascii=False, indent=2, default=str))
+    os.replace(tmp, p)  # un lector nunca ve el archivo a medio escribir
+    try:
+        history_index.index_session(session_id, history)
+    except sqlite3.Error:
+        pass  # el índice es derivado: sync() lo repara en la próxima búsqueda
+
+
+# Un lock por sesión: todo load → modificar → save_session del historial corre
+# bajo él, para que un refresh_story no pise un append concurrente (o viceversa).
+_session_locks: dict[str, threading.Lock] = {}
+_session_locks_guard = threading.Lock()
+
+
+def _session_lock(session_id: str) -> threading.Lock:
+    with _session_locks_guard:
+        return _session_locks.setdefault(session_id, threading.Lock())
+
+
+def append_session(session_id: str, entry: dict):
+    """Agrega una entrada al historial persistido (atómico respecto de la sesión)."""
+    with _session_lock(session_id):
+        hist = load_session(session_id)
+        hist.append(entry)
+        save_session(session_id, hist)
 
 
 def summarize_for_context(history: list, max_items: int = 4) -> str:
@@ -80,8 +123,9 @@ def suggest_questions(schema: dict, partial: str | None = None, k: int = 5) -> l
             user_content, ensure_ascii=False)}
     ]
     try:
-        resp = client.chat.completions.create(
-            model=MODEL,
+        resp = _complete(
+            stage="suggest",
+            model=MODELS["suggest"],
             messages=messages,
             response_format={"type": "json_object"},
             temperature=0.3,
@@ -156,8 +200,9 @@ def refine_question_step(
         )}
     ]
 
-    resp = client.chat.completions.create(
-        model=MODEL,
+    resp = _complete(
+        stage="refine",
+        model=MODELS["refine"],
         messages=messages,
         response_format={"type": "json_object"},
     )
@@ -184,8 +229,9 @@ def refine_question(user_question: str, schema: dict, session_id: str) -> dict:
             f"Pregunta del usuario:\n{user_question}\n"
         )}
     ]
-    resp = client.chat.completions.create(
-        model=MODEL,
+    resp = _complete(
+        stage="refine",
+        model=MODELS["refine"],
         messages=messages,
         response_format={"type": "json_object"}
     )
@@ -199,15 +245,110 @@ def refine_question(user_question: str, schema: dict, session_id: str) -> dict:
 
 # ========= LLM setup =========
 load_dotenv()
-client = OpenAI(api_key=os.getenv("GITHUB_API_KEY"),
-                base_url=os.getenv("BASE_URL"))
+if os.getenv("FAKE_LLM"):
+    # pruebas de carga / desarrollo offline (ver fake_llm.py)
+    from fake_llm import FakeClient
+    client = FakeClient()
+else:
+    # los reintentos los maneja el scheduler (con jitter y prioridad)
+    client = OpenAI(api_key=os.getenv("GITHUB_API_KEY"),
+                    base_url=os.getenv("BASE_URL"), max_retries=0)
 MODEL = os.getenv("MODEL")
+# Ruteo por etapa: refine/suggest pueden usar un modelo más chico y rápido.
+MODELS = {
+    "plan": os.getenv("MODEL_PLAN") or MODEL,
+    "refine": os.getenv("MODEL_REFINE") or MODEL,
+    "suggest": os.getenv("MODEL_SUGGEST") or MODEL,
+}
 SYSTEM = open("sample_prompts/system_sql_analyst.md").read()
 
+# Coalescing: pedidos idénticos en vuelo (mismo modelo + mensajes + params)
+# comparten una sola llamada al LLM.
+_llm_flight = SingleFlight("llm")
+_chart_flight = SingleFlight("chart")
+
+
+# Scheduler compartido: límites RPM/TPM, prioridad plan > refine > suggest, reintentos.
+scheduler = LLMScheduler()
+
+
+def _complete(stage: str = "plan", **kwargs):
+    key = hashlib.sha256(json.dumps(kwargs, sort_keys=True, ensure_ascii=False,
+                                    default=str).encode()).hexdigest()
+    est = estimate_tokens(kwargs.get("messages"))
+    resp, _shared = _llm_flight.do(key, lambda: scheduler.call(
+        stage, est, lambda: client.chat.completions.create(**kwargs)))
+    return resp
+
+
+# ========= Cache de refinamientos / planes =========
+# Misma pregunta (normalizada) + mismo esquema + mismo contexto de sesión →
+# misma respuesta del LLM. El contexto entra en la clave porque el prompt lo
+# incluye ("¿y por país?" depende de la pregunta anterior); warmup.py precarga
+# con contexto vacío, que es el de una sesión nueva. Un plan cuyo SQL falla o
+# no devuelve filas se descarta.
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))  # 0 = desactivado
+_plan_cache: OrderedDict = OrderedDict()
+_plan_cache_lock = threading.Lock()
+_plan_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _plan_key(kind: str, question: str, schema: dict, context: str = "") -> tuple:
+    q = " ".join((question or "").lower().split())
+    sk = hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode()).hexdigest()
+    ck = hashlib.sha256((context or "").encode()).hexdigest()
+    return kind, q, sk[:16], ck[:16]
+
+
+def plan_cache_get(kind: str, question: str, schema: dict, context: str = "") -> dict | None:
+    """
+    kind: "refine" (por pregunta original) o "plan" (por pregunta final).
+    context: resumen de sesión que va en el prompt (summarize_for_context).
+    """
+    if not PLAN_CACHE_SIZE:
+        return None
+    key = _plan_key(kind, question, schema, context)
+    with _plan_cache_lock:
+        value = _plan_cache.get(key)
+        _plan_cache_stats["hits" if value is not None else "misses"] += 1
+        if value is None:
+            return None
+        _plan_cache.move_to_end(key)
+    return copy.deepcopy(value)
+
+
+def plan_cache_put(kind: str, question: str, schema: dict, value: dict, context: str = ""):
+    if not PLAN_CACHE_SIZE:
+        return
+    with _plan_cache_lock:
+        _plan_cache[_plan_key(kind, question, schema, context)] = copy.deepcopy(value)
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+
+def forget_plan(question: str):
+    """Descarta los planes cacheados de una pregunta (su SQL falló o vino vacío)."""
+    q = " ".join((question or "").lower().split())
+    with _plan_cache_lock:
+        for key in [k for k in _plan_cache if k[0] == "plan" and k[1] == q]:
+            del _plan_cache[key]
+
+
+def plan_cache_stats() -> dict:
+    with _plan_cache_lock:
+        return {**_plan_cache_stats, "entries": len(_plan_cache)}
+
 
 # ========= Planificación =========
 def plan_query(user_question: str, schema: dict, session_id: str) -> dict:
     short_ctx = summarize_for_context(load_session(session_id))
+    cached = plan_cache_get("plan", user_question, schema, short_ctx)
+    if cached is not None:
+        return cached
+    try:
+        stats = stats_prompt()
+    except Exception:
+        stats = ""
     messages = [
         {"role": "system", "content": (
             SYSTEM
@@ -219,22 +360,35 @@ def plan_query(user_question: str, schema: dict, session_id: str) -> dict:
             "Formato de salida: JSON estricto. "
             "Entrega solo un objeto JSON, sin texto adicional."
             f"\nEsquema disponible (en JSON):\n{json.dumps(schema, ensure_ascii=False)}\n\n"
-            f"Pregunta: {user_question}"
+            + (("Estadísticas de los datos (rangos reales; para filtros de fecha usá "
+                "estos rangos en lugar de date('now')):\n" + stats + "\n\n") if stats else "")
+            + f"Pregunta: {user_question}"
         )}
     ]
-    resp = client.chat.completions.create(
-        model=MODEL,
+    resp = _complete(
+        stage="plan",
+        model=MODELS["plan"],
         messages=messages,
         response_format={"type": "json_object"}
     )
     out = json.loads(resp.choices[0].message.content)
     assert {"sql", "explain", "viz_suggestion", "notes"} <= set(out.keys())
+    plan_cache_put("plan", user_question, schema, out, short_ctx)
     return out
 
 # ========= Charting =========
 
 
 def make_chart(df: pd.DataFrame, viz: dict):
+    """PNG (BytesIO) del gráfico sugerido; renders idénticos en vuelo se comparten."""
+    if df.empty:
+        return None
+    key = (result_digest(df), json.dumps(viz or {}, sort_keys=True))
+    png, _shared = _chart_flight.do(key, lambda: _render_chart(df, viz))
+    return io.BytesIO(png) if png else None
+
+
+def _render_chart(df: pd.DataFrame, viz: dict) -> bytes | None:
     if df.empty:
         return None
     kind = (viz or {}).get("type", "none")
@@ -254,6 +408,11 @@ def make_chart(df: pd.DataFrame, viz: dict):
         df = df.copy()
         df[y] = pd.to_numeric(df[y], errors="coerce")
 
+    # Con dtypes ya tipados en tools_sql (datetime / categórica ordenada) basta
+    # ordenar; el regex queda como fallback si OPTIMIZE_DTYPES=0.
+    if pd.api.types.is_datetime64_any_dtype(df[x]) or (
+            isinstance(df[x].dtype, pd.CategoricalDtype) and df[x].cat.ordered):
+        df = df.sort_values(x)
     try:
         if pd.api.types.is_object_dtype(df[x]):
             if df[x].astype(str).str.match(r"^\d{4}[-/]\d{2}([-/]\d{2})?$").all():
@@ -268,28 +427,138 @@ def make_chart(df: pd.DataFrame, viz: dict):
     if df.empty:
         return None
 
-    plt.figure()
+    # Figure sin pyplot: sin estado global, seguro desde varios hilos (service.py)
+    fig = Figure()
+    ax = fig.subplots()
     if kind == "bar":
-        df.plot(kind="bar", x=x, y=y, legend=False)
+        df.plot(kind="bar", x=x, y=y, legend=False, ax=ax)
     elif kind == "line":
-        df.plot(kind="line", x=x, y=y, legend=False)
+        df.plot(kind="line", x=x, y=y, legend=False, ax=ax)
     else:
         return None
 
     buf = io.BytesIO()
-    plt.tight_layout()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    return buf
+    fig.tight_layout()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
 
 # ========= Orquestación / Respuesta =========
 
 
-def answer(user_question: str, session_id: str, auto_use_refined: bool = True):
+# ========= Presupuesto de recursos =========
+# Sobre este tamaño el resultado se degrada: sólo preview, sin chart.
+RESULT_SOFT_MB = float(os.getenv("RESULT_SOFT_MB", "64"))
+PREVIEW_ROWS = int(os.getenv("PREVIEW_ROWS", "200"))
+# tracemalloc es global al proceso: el pico es aproximado si hay otros hilos activos.
+TRACE_CHART_MEMORY = os.getenv("TRACE_CHART_MEMORY", "0") == "1"
+
+
+def _chart_within_budget(df: pd.DataFrame, viz: dict):
+    """
+    Aplica el presupuesto de memoria y arma el chart.
+    Devuelve (df, chart_bytes, resources), donde resources combina las
+    métricas de ejecución de tools_sql con las de la etapa de chart.
+    """
+    resources = dict(df.attrs.get("exec_stats") or {})
+    degraded = resources.get("result_bytes", 0) > RESULT_SOFT_MB * 1024 * 1024
+    resources["degraded"] = degraded
+    if degraded:
+        return df.head(PREVIEW_ROWS), None, resources
+
+    t0 = time.perf_counter()
+    started = False
+    if TRACE_CHART_MEMORY:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    try:
+        chart = make_chart(df, viz)
+        chart_bytes = chart.read() if chart else None
+    finally:
+        if TRACE_CHART_MEMORY:
+            resources["chart_peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            if started:
+                tracemalloc.stop()
+    resources["chart_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return df, chart_bytes, resources
+
+
+# ========= Refinamiento adaptativo =========
+_refine_lock = threading.Lock()
+_refine_stats = {"refined": 0, "skipped": 0, "skipped_failed": 0, "refine_s": 0.0}
+
+
+def _refine_or_skip(user_question: str, schema: dict, session_id: str) -> dict:
+    try:
+        values = low_cardinality_values()
+    except Exception:
+        values = None
+    precision = assess_question(user_question, schema, values)
+    if precision["precise"]:
+        with _refine_lock:
+            _refine_stats["skipped"] += 1
+        return {
+            "refined_question": user_question,
+            "clarifications": [],
+            "assumptions": [],
+            "confidence": precision["score"],
+            "skipped": True,
+            "precision": precision,
+        }
+    short_ctx = summarize_for_context(load_session(session_id))  # refine_question lo usa
+    refinement = plan_cache_get("refine", user_question, schema, short_ctx)
+    if refinement is None:
+        t0 = time.perf_counter()
+        refinement = refine_question(user_question, schema, session_id)
+        with _refine_lock:
+            _refine_stats["refined"] += 1
+            _refine_stats["refine_s"] += time.perf_counter() - t0
+        plan_cache_put("refine", user_question, schema, refinement, short_ctx)
+    refinement["precision"] = precision
+    return refinement
+
+
+def _record_skip_failure():
+    """Un salteo 'falló' si la consulta resultante dio error o vino vacía."""
+    with _refine_lock:
+        _refine_stats["skipped_failed"] += 1
+
+
+def refinement_metrics() -> dict:
+    with _refine_lock:
+        st = dict(_refine_stats)
+    total = st["refined"] + st["skipped"]
+    avg = st["refine_s"] / st["refined"] if st["refined"] else None
+    return {
+        "refined": st["refined"],
+        "skipped": st["skipped"],
+        "skip_rate": round(st["skipped"] / total, 3) if total else None,
+        "skipped_failed": st["skipped_failed"],
+        "skipped_failure_rate": (round(st["skipped_failed"] / st["skipped"], 3)
+                                 if st["skipped"] else None),
+        "avg_refine_ms": round(avg * 1000, 1) if avg is not None else None,
+        "est_saved_ms": round(avg * st["skipped"] * 1000, 1) if avg is not None else None,
+    }
+
+
+# Ejecuciones exactas en segundo plano (modo progresivo)
+_EXACT_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exact")
+
+
+def answer(user_question: str, session_id: str, auto_use_refined: bool = True,
+           progressive: bool = False, query_id: str | None = None):
+    """
+    Refina → planifica → ejecuta. Con progressive=True y una tabla grande
+    muestreada, devuelve enseguida el resultado aproximado (`approx` con la
+    metadata de la muestra) y `exact_future`, un Future con la respuesta exacta
+    (mismo formato que answer) que además se guarda en el historial.
+    `query_id` permite cancelar la ejecución exacta con tools_sql.cancel_query.
+    """
     schema = get_schema()
 
-    # 1) Refinar la pregunta
-    refinement = refine_question(user_question, schema, session_id)
+    # 1) Refinar la pregunta (salvo que el pre-chequeo local la considere precisa)
+    refinement = _refine_or_skip(user_question, schema, session_id)
     final_question = refinement.get("refined_question") or user_question
     if not auto_use_refined:
         final_question = user_question
@@ -298,13 +567,47 @@ def answer(user_question: str, session_id: str, auto_use_refined: bool = True):
     plan = plan_query(final_question, schema, session_id)
     sql = plan.get("sql", "")
 
+    if progressive:
+        try:
+            approx_df = run_sql_approx(sql)
+        except Exception:
+            approx_df = None
+        if approx_df is not None:
+            chart = make_chart(approx_df, plan.get("viz_suggestion", {}))
+            return {
+                "question_original": user_question,
+                "question_refined": final_question,
+                "refinement": refinement,
+                "plan": plan,
+                "sql": sql,
+                "df": approx_df,
+                "chart_bytes": chart.read() if chart else None,
+                "approx": approx_df.attrs.get("approx"),
+                "exact_future": _EXACT_POOL.submit(
+                    _execute, user_question, final_question, refinement, plan,
+                    session_id, query_id),
+                "error": None,
+            }
+
+    return _execute(user_question, final_question, refinement, plan, session_id, query_id)
+
+
+def _execute(user_question: str, final_question: str, refinement: dict,
+             plan: dict, session_id: str, query_id: str | None = None) -> dict:
+    """Ejecución exacta + chart + registro en historial."""
+    sql = plan.get("sql", "")
+    data_version = _data_version(sql)  # antes de ejecutar: conservador ante escrituras
     try:
-        df = run_sql(sql)
-        chart = make_chart(df, plan.get("viz_suggestion", {}))
+        df = run_sql(sql, query_id=query_id)
+        if df.empty:
+            forget_plan(final_question)  # vacío suele ser un filtro mal planeado
+            if refinement.get("skipped"):
+                _record_skip_failure()
+        df, chart_bytes, resources = _chart_within_budget(df, plan.get("viz_suggestion", {}))
+        digest = result_digest(df)
 
         # Guardar en historial (extendido)
-        hist = load_session(session_id)
-        hist.append({
+        append_session(session_id, {
             "ts": time.time(),
             "question": final_question,             # <-- compat UI
             "question_original": user_question,
@@ -313,9 +616,12 @@ def answer(user_question: str, session_id: str, auto_use_refined: bool = True):
             "plan": plan,
             "sql": sql,
             "df_head": df.head(20).to_dict(orient="records"),
+            "data_version": data_version,
+            "result_digest": digest,
+            "chart_file": _save_chart(chart_bytes, digest),
+            "resources": resources,
             "error": None,
         })
-        save_session(session_id, hist)
 
         return {
             "question_original": user_question,
@@ -324,13 +630,17 @@ def answer(user_question: str, session_id: str, auto_use_refined: bool = True):
             "plan": plan,
             "sql": sql,
             "df": df,
-            "chart_bytes": chart.read() if chart else None,
+            "chart_bytes": chart_bytes,
+            "resources": resources,
+            "result_digest": digest,
             "error": None,
         }
 
     except Exception as e:
-        hist = load_session(session_id)
-        hist.append({
+        if refinement.get("skipped"):
+            _record_skip_failure()
+        forget_plan(final_question)
+        append_session(session_id, {
             "ts": time.time(),
             "question": final_question,             # <-- compat UI
             "question_original": user_question,
@@ -339,9 +649,10 @@ def answer(user_question: str, session_id: str, auto_use_refined: bool = True):
             "plan": plan,
             "sql": sql,
             "df_head": None,
+            "data_version": data_version,
+            "result_digest": None,
             "error": str(e),
         })
-        save_session(session_id, hist)
 
         return {
             "question_original": user_question,
@@ -355,8 +666,111 @@ def answer(user_question: str, session_id: str, auto_use_refined: bool = True):
         }
 
 
+# ========= Versionado / refresco de Story =========
+CHARTS_DIR = SESS_DIR / "charts"
+
+
+def _data_version(sql: str) -> dict | None:
+    try:
+        return table_versions(sql_tables(sql))
+    except Exception:
+        return None
+
+
+def _save_chart(chart_bytes: bytes | None, digest: str) -> str | None:
+    """Guarda el PNG direccionado por contenido (mismo resultado → mismo archivo)."""
+    if not chart_bytes:
+        return None
+    CHARTS_DIR.mkdir(exist_ok=True)
+    p = CHARTS_DIR / f"{digest}.png"
+    if not p.exists():
+        p.write_bytes(chart_bytes)
+    return str(p)
+
+
+def is_stale(entry: dict, current: dict | None = None) -> bool:
+    """
+    True si alguna tabla fuente cambió desde que se calculó la entrada.
+    Entradas sin data_version (historial previo) o con tablas sin seguimiento
+    se consideran desactualizadas.
+    """
+    recorded = entry.get("data_version")
+    if not recorded or not entry.get("sql"):
+        return bool(entry.get("sql"))
+    current = current if current is not None else table_versions(list(recorded))
+    return any(v is None or current.get(t) != v for t, v in recorded.items())
+
+
+def _rerun_entry(entry: dict) -> dict:
+    sql = entry.get("sql", "")
+    data_version = _data_version(sql)
+    try:
+        df = run_sql(sql)
+        df, chart_bytes, resources = _chart_within_budget(
+            df, (entry.get("plan") or {}).get("viz_suggestion", {}))
+        digest = result_digest(df)
+        return {
+            "df_head": df.head(20).to_dict(orient="records"),
+            "data_version": data_version,
+            "result_digest": digest,
+            "chart_file": _save_chart(chart_bytes, digest),
+            "resources": resources,
+            "error": None,
+        }
+    except Exception as e:
+        return {"df_head": None, "data_version": data_version,
+                "result_digest": None, "error": str(e)}
+
+
+def refresh_story(session_id: str, indices: list[int] | None = None,
+                  max_workers: int = 4) -> dict:
+    """
+    Re-ejecuta (en paralelo) sólo las entradas del historial cuyas tablas fuente
+    cambiaron, actualizando snapshot, versión, digest y chart. `indices` limita
+    el refresco a esas entradas (p.ej. las marcadas en la Story).
+    Las consultas corren sin el lock de la sesión; al guardar se relee el
+    historial y sólo se actualizan las entradas que siguen siendo las mismas
+    (mismo ts y SQL), así no se pierden appends ni borrados concurrentes.
+    Devuelve {refreshed, unchanged, changed_results, seconds}.
+    """
+    t0 = time.perf_counter()
+    hist = load_session(session_id)
+    idxs = [i for i in (indices if indices is not None else range(len(hist)))
+            if 0 <= i < len(hist)]
+    current = table_versions()
+    stale = [i for i in idxs if is_stale(hist[i], current)]
+
+    changed = []
+    if stale:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            updates = list(pool.map(lambda i: _rerun_entry(hist[i]), stale))
+        with _session_lock(session_id):
+            latest = load_session(session_id)
+            for i, upd in zip(stale, updates):
+                same = (i < len(latest) and latest[i].get("ts") == hist[i].get("ts")
+                        and latest[i].get("sql") == hist[i].get("sql"))
+                if not same:
+                    continue  # la entrada cambió o se borró mientras se re-ejecutaba
+                if upd.get("result_digest") != latest[i].get("result_digest"):
+                    changed.append(i)
+                latest[i].update(upd, refreshed_at=time.time())
+            save_session(session_id, latest)
+
+    return {
+        "refreshed": stale,
+        "unchanged": [i for i in idxs if i not in stale],
+        "changed_results": changed,
+        "seconds": time.perf_counter() - t0,
+    }
+
+
 def clear_session(session_id: str):
     """Borra por completo el historial persistido de la sesión."""
     p = _session_path(session_id)
-    if p.exists():
-        p.unlink()
+    with _session_lock(session_id):
+        if p.exists():
+            p.unlink()
+    try:
+        history_index.remove_session(session_id)
+    except sqlite3.Error:
+        pass
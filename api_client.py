@@ -0,0 +1,123 @@
+"""
+Cliente HTTP delgado para service.py. Expone las mismas funciones que usa la UI
+(agent_core / tools_sql) para que ui_streamlit.py funcione como cliente cuando
+AGENT_API_URL está definido.
+"""
+import base64
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+
+import pandas as pd
+
+AGENT_API_URL = os.getenv("AGENT_API_URL", "http://127.0.0.1:8765").rstrip("/")
+API_TIMEOUT_S = float(os.getenv("API_TIMEOUT_S", "180"))
+API_RETRIES = int(os.getenv("API_RETRIES", "3"))
+
+
+def _request(method: str, path: str, payload: dict | None = None) -> dict:
+    data = json.dumps(payload, ensure_ascii=False).encode() if payload is not None else None
+    for attempt in range(API_RETRIES + 1):
+        req = urllib.request.Request(
+            AGENT_API_URL + path, data=data, method=method,
+            headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=API_TIMEOUT_S) as r:
+                return json.loads(r.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429 and attempt < API_RETRIES:
+                time.sleep(float(e.headers.get("Retry-After") or 1))
+                continue
+            detail = e.read().decode(errors="replace")
+            try:
+                detail = json.loads(detail).get("error", detail)
+            except ValueError:
+                pass
+            raise RuntimeError(f"API {e.code}: {detail}") from None
+
+
+def _df(columns, rows):
+    if columns is None:
+        return None
+    return pd.DataFrame(rows, columns=columns)
+
+
+# ===== agent_core =====
+
+def answer(user_question: str, session_id: str, auto_use_refined: bool = True,
+           progressive: bool = False, query_id: str | None = None):
+    # progressive no aplica vía HTTP: el servicio siempre devuelve el resultado exacto
+    out = _request("POST", "/answer", {"question": user_question, "session_id": session_id,
+                                       "auto_use_refined": auto_use_refined,
+                                       "query_id": query_id})
+    out["df"] = _df(out.pop("columns"), out.pop("rows"))
+    b64 = out.pop("chart_png_b64")
+    out["chart_bytes"] = base64.b64decode(b64) if b64 else None
+    return out
+
+
+def refine_question_step(base_question: str, schema: dict, session_id: str,
+                         user_selected_clarifications: list[str] | None = None,
+                         user_edited_question: str | None = None) -> dict:
+    return _request("POST", "/refine", {
+        "base_question": base_question, "schema": schema, "session_id": session_id,
+        "user_selected_clarifications": user_selected_clarifications,
+        "user_edited_question": user_edited_question})
+
+
+def suggest_questions(schema: dict, partial: str | None = None, k: int = 5) -> list[dict]:
+    return _request("POST", "/suggest", {"schema": schema, "partial": partial, "k": k})["suggestions"]
+
+
+def refresh_story(session_id: str, indices: list[int] | None = None,
+                  max_workers: int = 4) -> dict:
+    return _request("POST", "/story/refresh", {"session_id": session_id, "indices": indices})
+
+
+def search_history(text: str = "", session_id: str | None = None, page: int = 0,
+                   page_size: int = 20) -> tuple[list[dict], int]:
+    out = _request("GET", f"/history/search?q={quote(text)}&session_id={quote(session_id or '')}"
+                          f"&page={int(page)}&page_size={int(page_size)}")
+    return out["rows"], out["total"]
+
+
+def get_entries(ids: list[str]) -> list[dict]:
+    return _request("POST", "/history/entries", {"ids": ids})["entries"]
+
+
+def load_session(session_id: str) -> list:
+    return _request("GET", f"/history?session_id={quote(session_id)}")["history"]
+
+
+# ===== tools_sql =====
+
+def ensure_db():
+    """La DB la prepara el servicio; no-op en el cliente."""
+
+
+def get_schema():
+    return _request("GET", "/schema")["schema"]
+
+
+def get_foreign_keys():
+    return [tuple(r) for r in _request("GET", "/schema")["foreign_keys"]]
+
+
+def table_row_count(table: str) -> int:
+    return _request("GET", f"/table?name={quote(table)}&n=0")["row_count"]
+
+
+def sample_rows(table: str, n: int = 5):
+    out = _request("GET", f"/table?name={quote(table)}&n={int(n)}")
+    return _df(out["columns"], out["rows"])
+
+
+def cancel_query(query_id: str) -> bool:
+    return _request("POST", "/cancel", {"query_id": query_id})["cancelled"]
+
+
+def table_stats() -> dict:
+    return _request("GET", "/stats")["stats"]
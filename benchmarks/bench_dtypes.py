@@ -0,0 +1,64 @@
+"""
+Benchmark del tipado de resultados (OPTIMIZE_DTYPES): memoria del resultado,
+tiempo de chart y de export CSV, con y sin optimización.
+
+Uso:
+    python -m benchmarks.bench_dtypes --scale 50
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+_TMP = tempfile.mkdtemp(prefix="bench_dtypes_")
+os.environ["DB_PATH"] = str(Path(_TMP) / "bench.db")  # antes de importar tools_sql
+os.environ["RESULT_CACHE_MB"] = "0"  # medimos ejecuciones, no hits de cache
+os.environ.setdefault("ROW_LIMIT", "10000000")
+os.environ.setdefault("FAKE_LLM", "1")  # agent_core no necesita credenciales
+
+import tools_sql  # noqa: E402
+from seed_db import seed_db  # noqa: E402
+
+WIDE = ("SELECT o.order_id, o.order_date, strftime('%Y-%m', o.order_date) AS month, "
+        "c.country, p.category, p.name AS product, o.quantity, o.quantity * p.price AS revenue "
+        "FROM orders o JOIN customers c ON c.customer_id = o.customer_id "
+        "JOIN products p ON p.product_id = o.product_id")
+DAILY = ("SELECT order_date, SUM(quantity) AS units FROM orders "
+         "GROUP BY order_date ORDER BY order_date DESC")
+
+
+def _timed(fn, repeat: int = 5):
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=5, help="mejor de N (el ruido supera el 10%%)")
+    args = ap.parse_args()
+    seed_db(os.environ["DB_PATH"], scale=args.scale)
+
+    from agent_core import _render_chart  # sin coalescing: medimos el render real
+
+    print(f"{'modo':<10} {'filas':>9} {'MB':>8} {'fetch ms':>9} {'csv ms':>8} {'chart ms':>9}")
+    for optimize in (False, True):
+        tools_sql.OPTIMIZE_DTYPES = optimize
+        df, t_fetch = _timed(lambda: tools_sql.run_sql(WIDE + f" -- {optimize}"), args.repeat)
+        mb = df.memory_usage(deep=True).sum() / 1e6
+        _, t_csv = _timed(lambda: df.to_csv(index=False), args.repeat)
+        daily = tools_sql.run_sql(DAILY + f" -- {optimize}")
+        _, t_chart = _timed(lambda: _render_chart(daily, {"type": "line"}), args.repeat)
+        label = "tipado" if optimize else "object"
+        print(f"{label:<10} {len(df):>9} {mb:>8.1f} {t_fetch*1000:>9.0f} "
+              f"{t_csv*1000:>8.0f} {t_chart*1000:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark SQLite vs DuckDB sobre la DB sintética a distintos factores de escala.
+
+Uso:
+    python -m benchmarks.bench_engines --scales 1 10 50 --repeat 5
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from seed_db import seed_db
+from tools_sql import SQLiteEngine, DuckDBEngine, validate_sql, transpile_sql
+
+QUERIES = {
+    "ventas_por_mes": (
+        "SELECT strftime('%Y-%m', order_date) AS month, SUM(quantity) AS units "
+        "FROM orders GROUP BY month ORDER BY month"
+    ),
+    "revenue_por_categoria_mes": (
+        "SELECT p.category, strftime('%Y-%m', o.order_date) AS month, "
+        "SUM(o.quantity * p.price) AS revenue "
+        "FROM orders o JOIN products p ON p.product_id = o.product_id "
+        "GROUP BY p.category, month ORDER BY month, p.category"
+    ),
+    "top_paises": (
+        "SELECT c.country, COUNT(*) AS n_orders, SUM(o.quantity * p.price) AS revenue "
+        "FROM orders o JOIN customers c ON c.customer_id = o.customer_id "
+        "JOIN products p ON p.product_id = o.product_id "
+        "GROUP BY c.country ORDER BY revenue DESC"
+    ),
+}
+
+
+def _time(engine, sql: str, repeat: int) -> float:
+    sql = transpile_sql(validate_sql(sql), engine.dialect)
+    engine.query(sql)  # warm-up (conexión / conversión)
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        engine.query(sql)
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'scale':>5} {'query':<28} {'sqlite ms':>10} {'duckdb ms':>10} {'speedup':>8}")
+        for scale in args.scales:
+            db = Path(tmp) / f"bench_x{scale}.db"
+            seed_db(str(db), scale=scale)
+            engines = [
+                SQLiteEngine(db_path=db),
+                DuckDBEngine(db_path=db, copy_path=db.with_suffix(".duckdb")),
+            ]
+            for qname, sql in QUERIES.items():
+                t_sqlite, t_duck = (_time(e, sql, args.repeat) for e in engines)
+                print(f"{scale:>5} {qname:<28} {t_sqlite*1000:>10.1f} "
+                      f"{t_duck*1000:>10.1f} {t_sqlite / t_duck:>7.1f}x")
+            engines[1].reset()
+
+
+if __name__ == "__main__":
+    main()
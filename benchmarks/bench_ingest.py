@@ -0,0 +1,79 @@
+"""
+Benchmark de ingesta columnar: carga por lotes en SQLite vs lectura en el lugar
+con DuckDB, midiendo throughput de ingesta y latencia de consulta posterior.
+
+Uso:
+    python -m benchmarks.bench_ingest --rows 1000000 --parts 8
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+_TMP = tempfile.mkdtemp(prefix="bench_ingest_")
+os.environ["DB_PATH"] = str(Path(_TMP) / "bench.db")  # antes de importar tools_sql
+os.environ["RESULT_CACHE_MB"] = "0"  # medimos ejecuciones, no hits de cache
+
+import numpy as np  # noqa: E402
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from ingest import ingest_file, register_external  # noqa: E402
+from tools_sql import run_sql  # noqa: E402
+
+QUERY = ("SELECT category, strftime('%Y-%m', sale_date) AS month, SUM(amount) AS revenue "
+         "FROM {table} GROUP BY category, month ORDER BY month, category")
+
+
+def _write_parts(root: Path, rows: int, parts: int) -> Path:
+    rng = np.random.default_rng(0)
+    per = rows // parts
+    for i in range(parts):
+        days = rng.integers(0, 600, per)
+        tbl = pa.table({
+            "sale_id": np.arange(i * per, (i + 1) * per),
+            "category": rng.choice(["Electronics", "Home", "Sports", "Beauty", "Books"], per),
+            "amount": rng.uniform(5, 500, per).round(2),
+            "sale_date": (np.datetime64("2024-01-01") + days).astype("datetime64[D]"),
+        })
+        d = root / f"part={i}"
+        d.mkdir(parents=True, exist_ok=True)
+        pq.write_table(tbl, d / "data.parquet")
+    return root
+
+
+def _latency(table: str, engine: str, repeat: int) -> float:
+    sql = QUERY.format(table=table)
+    run_sql(sql, engine=engine)
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        run_sql(sql, engine=engine)
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--parts", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    src = _write_parts(Path(_TMP) / "sales", args.rows, args.parts)
+
+    loaded = ingest_file(str(src), table="sales_loaded")
+    print(f"ingest_file (SQLite):       {loaded['rows']:>10} filas  "
+          f"{loaded['seconds']:.2f}s  {loaded['rows_per_s']:,.0f} filas/s")
+    ext = register_external(str(src), table="sales_ext")
+    print(f"register_external (DuckDB): {ext['rows']:>10} filas  {ext['seconds']:.2f}s")
+
+    print(f"query SQLite (cargada):   {_latency('sales_loaded', 'sqlite', args.repeat)*1000:8.1f} ms")
+    print(f"query DuckDB (cargada):   {_latency('sales_loaded', 'duckdb', args.repeat)*1000:8.1f} ms")
+    print(f"query DuckDB (en lugar):  {_latency('sales_ext', 'duckdb', args.repeat)*1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
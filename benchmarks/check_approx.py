@@ -0,0 +1,87 @@
+"""
+Chequeo de la reescritura aproximada (rewrite_for_sample) contra la consulta exacta.
+
+La "muestra" es una copia completa de `orders` declarada con tasa --rate: así el
+resultado es determinístico y se puede comparar sin tolerancias estadísticas.
+- totales (SUM/COUNT): aproximado == exacto / tasa
+- cocientes (SUM/COUNT, SUM/SUM, ...): aproximado == exacto
+
+Sale con código 1 si alguna consulta no coincide.
+
+Uso:
+    python -m benchmarks.check_approx --rate 0.1
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from seed_db import seed_db
+from tools_sql import SQLiteEngine, _sample_name, rewrite_for_sample
+
+# nombre → (sql, tipo): "total" se escala por 1/tasa, "ratio" no. La última
+# columna es el agregado; las anteriores (claves de grupo) deben coincidir tal cual.
+QUERIES = {
+    "unidades_por_mes": (
+        "SELECT strftime('%Y-%m', order_date) AS month, SUM(quantity) AS units "
+        "FROM orders GROUP BY month ORDER BY month", "total"),
+    "ordenes_por_producto": (
+        "SELECT product_id, COUNT(*) AS n FROM orders GROUP BY product_id "
+        "HAVING COUNT(*) > 0 ORDER BY product_id", "total"),
+    "promedio_sum_count": (
+        "SELECT customer_id, SUM(quantity) * 1.0 / COUNT(*) AS avg_qty "
+        "FROM orders GROUP BY customer_id ORDER BY customer_id", "ratio"),
+    "cociente_entero": (
+        "SELECT product_id, SUM(quantity) / COUNT(*) AS avg_int "
+        "FROM orders GROUP BY product_id ORDER BY product_id", "ratio"),
+    "participacion": (
+        "SELECT product_id, 100.0 * SUM(quantity) / SUM(quantity + 1) AS pct "
+        "FROM orders GROUP BY product_id ORDER BY product_id", "ratio"),
+}
+
+
+def _compare(exact, approx, factor: float) -> float:
+    """Error relativo del agregado (última columna) frente a exacto * factor."""
+    keys = list(exact.columns[:-1])
+    if not exact[keys].equals(approx[keys]):
+        return float("inf")
+    e = pd.to_numeric(exact.iloc[:, -1]).to_numpy(dtype=float) * factor
+    a = pd.to_numeric(approx.iloc[:, -1]).to_numpy(dtype=float)
+    return float(np.max(np.abs(a - e) / np.maximum(np.abs(e), 1e-9)))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, default=0.1)
+    ap.add_argument("--scale", type=int, default=1)
+    args = ap.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "check_approx.db"
+        seed_db(str(db), scale=args.scale)
+        with sqlite3.connect(db) as cx:
+            cx.execute(f'CREATE TABLE "{_sample_name("orders")}" AS SELECT * FROM orders')
+        eng = SQLiteEngine(db_path=db)
+        print(f"{'query':<24} {'tipo':<6} {'error rel.':>10}  ok")
+        for name, (sql, kind) in QUERIES.items():
+            rewritten = rewrite_for_sample(sql, {"orders": args.rate})
+            if rewritten is None:
+                print(f"{name:<24} {kind:<6} {'n/a':>10}  ✗ (no aproximable)")
+                failed += 1
+                continue
+            exact = eng.query(sql)
+            approx = eng.query(rewritten[0])[list(exact.columns)]
+            err = _compare(exact, approx, 1 / args.rate if kind == "total" else 1.0)
+            ok = err < 1e-9
+            failed += not ok
+            print(f"{name:<24} {kind:<6} {err:>10.2e}  {'✓' if ok else '✗'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Prueba de carga del servicio HTTP con el LLM falso.
+
+Levanta service.py en proceso (FAKE_LLM=1) o apunta a --url, dispara N clientes
+concurrentes durante --seconds y reporta throughput, latencias p50/p95/p99 y 429s.
+
+Uso:
+    python -m benchmarks.load_test --clients 16 --seconds 20 --workers 4 --queue 8
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+QUESTIONS = [
+    "ventas por categoría por mes",
+    "top 10 productos por revenue",
+    "evolución mensual por país",
+    "clientes con mayor ticket promedio",
+]
+
+
+def _post(url: str, payload: dict) -> int:
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), method="POST",
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=300) as r:
+            r.read()
+            return r.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+
+
+def _client(base: str, idx: int, deadline: float, stats: dict, lock: threading.Lock):
+    sid = f"load-{idx}"
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        code = _post(base + "/answer", {"question": random.choice(QUESTIONS), "session_id": sid})
+        dt = time.perf_counter() - t0
+        with lock:
+            stats["codes"][code] = stats["codes"].get(code, 0) + 1
+            if code == 200:
+                stats["lat"].append(dt)
+        if code == 429:
+            time.sleep(0.2)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=20)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--queue", type=int, default=8)
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    args = ap.parse_args()
+
+    server = None
+    base = args.url
+    if not base:
+        os.environ["FAKE_LLM"] = "1"
+        os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+        from service import make_server
+        server = make_server(port=0, workers=args.workers, queue_size=args.queue)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+    base = base.rstrip("/")
+
+    stats, lock = {"codes": {}, "lat": []}, threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=_client, args=(base, i, deadline, stats, lock))
+               for i in range(args.clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    lat = sorted(stats["lat"])
+    ok = len(lat)
+    print(f"clientes={args.clients} duración={elapsed:.1f}s respuestas={stats['codes']}")
+    print(f"throughput: {ok / elapsed:.2f} req/s")
+    if lat:
+        q = statistics.quantiles(lat, n=100, method="inclusive") if len(lat) > 1 else [lat[0]] * 99
+        print(f"latencia ms: p50={q[49]*1000:.0f} p95={q[94]*1000:.0f} "
+              f"p99={q[98]*1000:.0f} max={lat[-1]*1000:.0f}")
+    with urllib.request.urlopen(base + "/metrics") as r:
+        print("metrics:", r.read().decode())
+
+    if server:
+        server.shutdown()
+        server.pool.shutdown()
+        from agent_core import clear_session
+        for i in range(args.clients):
+            clear_session(f"load-{i}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Exportación de resultados bajo demanda: Parquet, Arrow IPC, CSV y CSV gzip.
+
+- Los artefactos se guardan en .session/exports/<digest>.<ext>, direccionados
+  por la huella del resultado (tools_sql.result_digest): la segunda descarga
+  del mismo resultado no recalcula nada.
+- export_df escribe desde el DataFrame en memoria por tramos; export_sql
+  re-ejecuta la consulta y escribe por chunks (resultados degradados a
+  preview o entradas de Story), calculando la huella mientras escribe.
+  Un índice (sql + versión de datos) → huella evita re-ejecutar si los datos
+  no cambiaron.
+- export_story arma un .zip con story.md, los resultados y los charts.
+- El cache se poda por antigüedad de uso cuando supera EXPORT_CACHE_MB.
+"""
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import zipfile
+
+import pandas as pd
+
+EXPORT_DIR = pathlib.Path("./.session/exports")
+EXPORT_CACHE_MB = float(os.getenv("EXPORT_CACHE_MB", "512"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+
+# formato → (extensión, mime)
+FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+    "csv.gz": (".csv.gz", "application/gzip"),
+    "csv": (".csv", "text/csv"),
+}
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _path(digest: str, fmt: str) -> pathlib.Path:
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato de exportación desconocido: {fmt}")
+    return EXPORT_DIR / f"{digest}{FORMATS[fmt][0]}"
+
+
+def _hit(p: pathlib.Path) -> pathlib.Path | None:
+    if p.exists():
+        os.utime(p)  # LRU por mtime
+        with _lock:
+            _stats["hits"] += 1
+        return p
+    return None
+
+
+class _Writer:
+    """
+    Escribe chunks de DataFrame en el formato pedido. El esquema Arrow sale de
+    `schema` o del primer chunk; si un chunk posterior no entra (columna toda NULL
+    al principio, enteros que después traen decimales) se promueve a un esquema
+    común y se re-escribe lo ya escrito.
+    """
+
+    def __init__(self, path: pathlib.Path, fmt: str, schema=None):
+        self.path, self.fmt = path, fmt
+        self._w = None
+        self._schema = schema
+
+    def _open(self, schema):
+        import pyarrow as pa
+        self._schema = schema
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._w = pq.ParquetWriter(self.path, schema, compression="zstd")
+        else:
+            self._w = pa.ipc.new_file(self.path, schema)
+
+    def _batches(self, path: pathlib.Path):
+        import pyarrow as pa
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            yield from pq.ParquetFile(path).iter_batches()
+            return
+        with pa.memory_map(str(path)) as src:
+            reader = pa.ipc.open_file(src)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+    def _promote(self, table):
+        import pyarrow as pa
+        schema = pa.unify_schemas([self._schema, table.schema],
+                                  promote_options="permissive").remove_metadata()
+        self._w.close()
+        old = self.path.with_name(self.path.name + ".part")
+        os.replace(self.path, old)
+        try:
+            self._open(schema)
+            for batch in self._batches(old):
+                self._w.write_table(pa.Table.from_batches([batch]).cast(schema))
+        finally:
+            old.unlink(missing_ok=True)
+        return table.cast(schema)
+
+    def write(self, chunk: pd.DataFrame):
+        if self.fmt in ("csv", "csv.gz"):
+            if self._w is None:
+                opener = gzip.open if self.fmt == "csv.gz" else open
+                self._w = opener(self.path, "wt", newline="", encoding="utf-8")
+                chunk.to_csv(self._w, index=False)
+            else:
+                chunk.to_csv(self._w, index=False, header=False)
+            return
+        import pyarrow as pa
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._w is None:
+            self._open(self._schema or table.schema)
+        if not table.schema.equals(self._schema):
+            try:
+                table = table.cast(self._schema)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                table = self._promote(table)
+        self._w.write_table(table)
+
+    def close(self):
+        if self._w is not None:
+            self._w.close()
+
+
+def _write(chunks, fmt: str, tmp: pathlib.Path, schema=None) -> str:
+    """Escribe los chunks en tmp y devuelve la huella (misma fórmula que result_digest)."""
+    h = None
+    w = _Writer(tmp, fmt, schema)
+    done = False
+    try:
+        for chunk in chunks:
+            if h is None:
+                h = hashlib.sha256("\x1f".join(map(str, chunk.columns)).encode())
+            h.update(pd.util.hash_pandas_object(chunk, index=False).values.tobytes())
+            w.write(chunk)
+        if h is None:  # sin chunks: el motor no devolvió ni siquiera el esquema
+            raise ValueError("La consulta no devolvió columnas para exportar")
+        done = True
+    finally:
+        w.close()
+        if not done:
+            tmp.unlink(missing_ok=True)  # sin .tmp huérfanos si la consulta o el disco fallan
+    return h.hexdigest()[:16]
+
+
+def _slices(df: pd.DataFrame):
+    if df.empty:
+        yield df
+    for i in range(0, len(df), EXPORT_CHUNK_ROWS):
+        yield df.iloc[i:i + EXPORT_CHUNK_ROWS]
+
+
+def export_df(df: pd.DataFrame, fmt: str = "parquet", digest: str | None = None) -> pathlib.Path:
+    """Exporta un resultado en memoria; `digest` evita recalcular la huella."""
+    from tools_sql import result_digest
+    digest = digest or result_digest(df)
+    p = _path(digest, fmt)
+    if _hit(p):
+        return p
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + f".{threading.get_ident()}.tmp")
+    schema = None
+    if fmt in ("parquet", "arrow"):
+        import pyarrow as pa
+        # esquema del df completo: una columna NULL en el primer tramo no lo fija
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+    _write(_slices(df), fmt, tmp, schema)
+    os.replace(tmp, p)
+    with _lock:
+        _stats["misses"] += 1
+    _prune()
+    return p
+
+
+def _query_key(sql: str, data_version: dict | None) -> str | None:
+    if not data_version or any(v is None for v in data_version.values()):
+        return None  # tablas sin seguimiento: no sabemos si cambiaron
+    return hashlib.sha256(json.dumps([sql, data_version], sort_keys=True).encode()).hexdigest()
+
+
+def _index_path() -> pathlib.Path:
+    return EXPORT_DIR / "_by_query.json"
+
+
+def _index() -> dict:
+    try:
+        return json.loads(_index_path().read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def export_sql(sql: str, fmt: str = "parquet") -> pathlib.Path:
+    """
+    Re-ejecuta `sql` (tools_sql.iter_sql) y escribe por chunks. Si la misma
+    consulta ya se exportó con la misma versión de datos, devuelve el archivo.
+    """
+    from tools_sql import iter_sql, sql_tables, table_versions
+    key = _query_key(sql, table_versions(sql_tables(sql)))
+    if key:
+        digest = _index().get(key)
+        if digest and _hit(_path(digest, fmt)):
+            return _path(digest, fmt)
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = EXPORT_DIR / f"_stream.{threading.get_ident()}{FORMATS[fmt][0]}.tmp"
+    digest = _write(iter_sql(sql, chunk_rows=EXPORT_CHUNK_ROWS), fmt, tmp)
+    p = _path(digest, fmt)
+    os.replace(tmp, p)
+    if key:
+        with _lock:
+            idx = _index()
+            idx[key] = digest
+            _index_path().write_text(json.dumps(idx))
+    with _lock:
+        _stats["misses"] += 1
+    _prune()
+    return p
+
+
+def export_result(res: dict, fmt: str = "parquet") -> pathlib.Path:
+    """
+    Exporta una respuesta de answer(): desde el df si está completo; si se
+    degradó a preview (o no hay df) vuelve a la consulta por chunks.
+    """
+    df = res.get("df")
+    if df is not None and not (res.get("resources") or {}).get("degraded"):
+        return export_df(df, fmt, res.get("result_digest"))
+    return export_sql(res["sql"], fmt)
+
+
+def mime(fmt: str) -> str:
+    return FORMATS[fmt][1]
+
+
+def story_markdown(entries: list[dict], files: dict | None = None) -> str:
+    """Story en Markdown; `files` ({id: (resultado, chart)}) agrega links relativos."""
+    files = files or {}
+    md = ["# Story - Data Analyst Agent\n"]
+    for it in entries:
+        md += [
+            f"## {it.get('question', '')}",
+            "```sql",
+            it.get("sql", ""),
+            "```",
+            (it.get("plan") or {}).get("explain", ""),
+            "",
+        ]
+        data, chart = files.get(it.get("id"), (None, None))
+        if chart:
+            md += [f"![chart]({chart})", ""]
+        if data:
+            md += [f"Datos: [{data.rsplit('/', 1)[-1]}]({data})", ""]
+    return "\n".join(md)
+
+
+def export_story(entries: list[dict], fmt: str = "parquet") -> pathlib.Path:
+    """
+    .zip con story.md + results/ (datos actuales de cada consulta) + charts/
+    (PNG guardado en el historial). Los archivos de resultado salen del cache.
+    """
+    files, members = {}, []
+    for it in entries:
+        data = chart = None
+        if it.get("sql") and not it.get("error"):
+            try:
+                p = export_sql(it["sql"], fmt)
+                data = f"results/{p.name}"
+                members.append((p, data))
+            except Exception:
+                data = None
+        cf = it.get("chart_file")
+        if cf and pathlib.Path(cf).exists():
+            chart = f"charts/{pathlib.Path(cf).name}"
+            members.append((pathlib.Path(cf), chart))
+        files[it.get("id")] = (data, chart)
+    md = story_markdown(entries, files)
+    key = hashlib.sha256((md + fmt).encode()).hexdigest()[:16]
+    p = EXPORT_DIR / f"story_{key}.zip"
+    if _hit(p):
+        return p
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(p.name + ".tmp")
+    with zipfile.ZipFile(tmp, "w") as z:
+        z.writestr("story.md", md, compress_type=zipfile.ZIP_DEFLATED)
+        for arc, src in dict((a, s) for s, a in members).items():  # sin duplicados
+            # parquet / gzip / png ya vienen comprimidos
+            z.write(src, arc, compress_type=zipfile.ZIP_STORED)
+    os.replace(tmp, p)
+    _prune()
+    return p
+
+
+def _prune():
+    """Borra los artefactos usados hace más tiempo si el cache supera EXPORT_CACHE_MB."""
+    files = [f for f in EXPORT_DIR.glob("*") if f.is_file()
+             and not f.name.startswith("_") and not f.name.endswith(".tmp")]
+    total = sum(f.stat().st_size for f in files)
+    limit = EXPORT_CACHE_MB * 1024 * 1024
+    for f in sorted(files, key=lambda f: f.stat().st_mtime):
+        if total <= limit:
+            break
+        total -= f.stat().st_size
+        f.unlink(missing_ok=True)
+
+
+def export_stats() -> dict:
+    with _lock:
+        return dict(_stats)
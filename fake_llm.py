@@ -0,0 +1,81 @@
+"""
+Cliente LLM falso (misma forma que `OpenAI().chat.completions.create`) para
+pruebas de carga y desarrollo offline. Se activa con FAKE_LLM=1.
+
+FAKE_LLM_LATENCY_MS simula la latencia del proveedor (default 300 ms).
+"""
+import json
+import os
+import random
+import time
+import zlib
+from types import SimpleNamespace
+
+_PLANS = [
+    {
+        "sql": "SELECT strftime('%Y-%m', order_date) AS month, SUM(quantity) AS units "
+               "FROM orders GROUP BY month ORDER BY month",
+        "explain": "Unidades vendidas por mes.",
+        "viz_suggestion": {"type": "line"},
+        "notes": "Respuesta generada por FAKE_LLM.",
+    },
+    {
+        "sql": "SELECT p.category, SUM(o.quantity * p.price) AS revenue FROM orders o "
+               "JOIN products p ON p.product_id = o.product_id GROUP BY p.category "
+               "ORDER BY revenue DESC",
+        "explain": "Revenue por categoría.",
+        "viz_suggestion": {"type": "bar"},
+        "notes": "Respuesta generada por FAKE_LLM.",
+    },
+    {
+        "sql": "SELECT c.country, COUNT(*) AS n_orders FROM orders o JOIN customers c "
+               "ON c.customer_id = o.customer_id GROUP BY c.country ORDER BY n_orders DESC",
+        "explain": "Órdenes por país.",
+        "viz_suggestion": {"type": "bar"},
+        "notes": "Respuesta generada por FAKE_LLM.",
+    },
+]
+
+
+def _content_for(messages: list[dict]) -> dict:
+    system = messages[0].get("content", "") if messages else ""
+    user = messages[-1].get("content", "") if messages else ""
+    if system.startswith("Eres un analista de negocio senior"):
+        return {"suggestions": [
+            {"question": "ventas por categoría por mes", "why": "mix", "tags": ["ventas"]},
+            {"question": "top 10 productos por revenue", "why": "ranking", "tags": ["top"]},
+            {"question": "órdenes por país", "why": "mercados", "tags": ["país"]},
+        ]}
+    if system.startswith("Eres un PM/BI senior"):
+        if "Pregunta del usuario:\n" in user:
+            q = user.split("Pregunta del usuario:\n", 1)[1].strip()
+        else:
+            guidance = json.loads(user.split("Instrucciones de usuario (JSON):\n", 1)[1])
+            q = guidance.get("effective_question", "")
+        return {"refined_question": q, "clarifications": [], "assumptions": [],
+                "confidence": 0.9}
+    # planificación: plan determinista por pregunta (estable entre procesos)
+    return _PLANS[zlib.crc32(user.encode()) % len(_PLANS)]
+
+
+class _Completions:
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    def create(self, model=None, messages=None, **kwargs):
+        if self.latency_s:
+            time.sleep(random.uniform(0.5, 1.5) * self.latency_s)
+        content = json.dumps(_content_for(messages or []), ensure_ascii=False)
+        msg = SimpleNamespace(content=content, role="assistant")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=msg, finish_reason="stop")],
+            usage=SimpleNamespace(prompt_tokens=len(json.dumps(messages)) // 4,
+                                  completion_tokens=len(content) // 4),
+        )
+
+
+class FakeClient:
+    def __init__(self, latency_ms: float | None = None):
+        if latency_ms is None:
+            latency_ms = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+        self.chat = SimpleNamespace(completions=_Completions(latency_ms / 1000))
@@ -0,0 +1,178 @@
+"""
+Índice de historial para el sidebar de Storytelling.
+
+Tabla FTS5 (SQLite) sobre pregunta, SQL y explicación de todas las sesiones en
+.session/, más una copia de cada entrada para exportar por id sin cargar
+sesiones completas. Se actualiza al guardar (index_session) y, para archivos
+modificados por fuera, con sync() comparando mtime/tamaño.
+
+Ids de entrada: "<session_id>:<índice>".
+"""
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+
+SESS_DIR = pathlib.Path("./.session")
+INDEX_PATH = SESS_DIR / "_index.db"
+SYNC_MIN_INTERVAL_S = 2.0
+
+_lock = threading.Lock()
+_last_sync = 0.0
+
+
+def _conn():
+    SESS_DIR.mkdir(exist_ok=True)
+    cx = sqlite3.connect(INDEX_PATH, timeout=10, check_same_thread=False)
+    cx.executescript("""
+    CREATE TABLE IF NOT EXISTS files (
+      session_id TEXT PRIMARY KEY, mtime REAL, size INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS entries (
+      id TEXT PRIMARY KEY, session_id TEXT, idx INTEGER, ts REAL,
+      question TEXT, has_error INTEGER, entry_json TEXT
+    );
+    CREATE INDEX IF NOT EXISTS entries_ts ON entries(ts DESC);
+    CREATE INDEX IF NOT EXISTS entries_session ON entries(session_id, ts DESC);
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+      id UNINDEXED, question, sql, explain, tokenize = 'unicode61 remove_diacritics 2'
+    );
+    """)
+    return cx
+
+
+def _replace_session(cx, session_id: str, history: list):
+    ids = [r[0] for r in cx.execute(
+        "SELECT id FROM entries WHERE session_id = ?", (session_id,)).fetchall()]
+    cx.executemany("DELETE FROM entries_fts WHERE id = ?", [(i,) for i in ids])
+    cx.execute("DELETE FROM entries WHERE session_id = ?", (session_id,))
+    rows, fts = [], []
+    for idx, h in enumerate(history):
+        eid = f"{session_id}:{idx}"
+        question = h.get("question_refined") or h.get("question") or ""
+        explain = (h.get("plan") or {}).get("explain", "") or ""
+        rows.append((eid, session_id, idx, h.get("ts") or 0.0, question,
+                     1 if h.get("error") else 0, json.dumps(h, ensure_ascii=False, default=str)))
+        fts.append((eid, question, h.get("sql", "") or "", explain))
+    cx.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    cx.executemany("INSERT INTO entries_fts VALUES (?, ?, ?, ?)", fts)
+
+
+def index_session(session_id: str, history: list):
+    """Re-indexa una sesión (llamado desde save_session)."""
+    p = SESS_DIR / f"{session_id}.json"
+    with _lock, _conn() as cx:
+        _replace_session(cx, session_id, history)
+        if p.exists():
+            st = p.stat()
+            cx.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                       (session_id, st.st_mtime, st.st_size))
+
+
+def remove_session(session_id: str):
+    with _lock, _conn() as cx:
+        _replace_session(cx, session_id, [])
+        cx.execute("DELETE FROM files WHERE session_id = ?", (session_id,))
+
+
+def sync(force: bool = False) -> int:
+    """Indexa archivos .session/*.json nuevos o modificados. Devuelve cuántos."""
+    global _last_sync
+    now = time.monotonic()
+    if not force and now - _last_sync < SYNC_MIN_INTERVAL_S:
+        return 0
+    _last_sync = now
+    with _lock, _conn() as cx:
+        known = {r[0]: (r[1], r[2]) for r in cx.execute("SELECT * FROM files").fetchall()}
+        seen, changed = set(), 0
+        for p in SESS_DIR.glob("*.json"):
+            sid = p.stem
+            seen.add(sid)
+            st = p.stat()
+            if known.get(sid) == (st.st_mtime, st.st_size):
+                continue
+            try:
+                history = json.loads(p.read_text())
+            except (ValueError, OSError):
+                continue
+            _replace_session(cx, sid, history)
+            cx.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+                       (sid, st.st_mtime, st.st_size))
+            changed += 1
+        for sid in set(known) - seen:
+            _replace_session(cx, sid, [])
+            cx.execute("DELETE FROM files WHERE session_id = ?", (sid,))
+            changed += 1
+    return changed
+
+
+def _fts_query(text: str) -> str:
+    # cada término como prefijo literal: "ventas mes" → "ventas"* "mes"*
+    terms = [t.replace('"', '""') for t in text.split() if t.strip()]
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def search(text: str = "", session_id: str | None = None, page: int = 0,
+           page_size: int = 20) -> tuple[list[dict], int]:
+    """
+    Busca en el historial (todas las sesiones o una). Sin texto, lista las más
+    recientes. Devuelve (filas de la página, total).
+    Filas: {id, session_id, idx, ts, question, has_error}.
+    """
+    sync()
+    where, args = [], []
+    if session_id:
+        where.append("e.session_id = ?")
+        args.append(session_id)
+    if text.strip():
+        where.append("e.id IN (SELECT id FROM entries_fts WHERE entries_fts MATCH ?)")
+        args.append(_fts_query(text))
+    clause = ("WHERE " + " AND ".join(where)) if where else ""
+    with _conn() as cx:
+        total = cx.execute(f"SELECT COUNT(*) FROM entries e {clause}", args).fetchone()[0]
+        rows = cx.execute(
+            f"SELECT e.id, e.session_id, e.idx, e.ts, e.question, e.has_error "
+            f"FROM entries e {clause} ORDER BY e.ts DESC LIMIT ? OFFSET ?",
+            args + [page_size, max(0, page) * page_size]).fetchall()
+    keys = ("id", "session_id", "idx", "ts", "question", "has_error")
+    return [dict(zip(keys, r)) for r in rows], total
+
+
+def get_entries(ids: list[str]) -> list[dict]:
+    """Entradas completas por id, en el orden pedido (ids inexistentes se omiten)."""
+    if not ids:
+        return []
+    with _conn() as cx:
+        marks = ", ".join("?" * len(ids))
+        found = dict(cx.execute(
+            f"SELECT id, entry_json FROM entries WHERE id IN ({marks})", ids).fetchall())
+    out = []
+    for i in ids:
+        if i in found:
+            entry = json.loads(found[i])
+            entry["id"] = i
+            out.append(entry)
+    return out
+
+
+def frequent_questions(limit: int = 5) -> list[dict]:
+    """
+    Preguntas exitosas más repetidas en todas las sesiones (agrupadas sin
+    distinguir mayúsculas), con la entrada más reciente de cada una y `count`.
+    """
+    sync(force=True)
+    with _conn() as cx:
+        groups = cx.execute(
+            "SELECT lower(question) AS q, COUNT(*) AS n FROM entries "
+            "WHERE has_error = 0 AND question != '' GROUP BY q "
+            "ORDER BY n DESC, MAX(ts) DESC LIMIT ?", (limit,)).fetchall()
+        out = []
+        for q, n in groups:
+            eid, raw = cx.execute(
+                "SELECT id, entry_json FROM entries WHERE lower(question) = ? AND has_error = 0 "
+                "ORDER BY ts DESC LIMIT 1", (q,)).fetchone()
+            entry = json.loads(raw)
+            entry.update(id=eid, count=n)
+            out.append(entry)
+    return out
@@ -0,0 +1,221 @@
+"""
+Ingesta de archivos columnares (Parquet / CSV) como tablas consultables.
+
+Dos modos:
+- ingest_file: carga por lotes (record batches de Arrow) dentro de la DB SQLite,
+  con executemany en una sola transacción; sin inserts fila a fila.
+- register_external: registra el archivo (o un directorio de particiones) para
+  que DuckDB lo lea en el lugar (lectura columnar, sin copiar filas). Sólo
+  visible con SQL_ENGINE=duckdb.
+
+Uso:
+    python ingest.py ruta/ventas.parquet [--table ventas] [--external]
+"""
+import argparse
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from tools_sql import DB_PATH, _conn, _ident, ensure_db, get_engine
+
+REGISTRY_PATH = DB_PATH.parent / "external_tables.json"
+CHUNK_ROWS = 100_000
+
+_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".csv": "csv"}
+
+# =========================================
+# Helpers
+# =========================================
+
+def _table_name(path: Path, table: str | None) -> str:
+    name = table or path.stem
+    name = re.sub(r"\W+", "_", name).strip("_").lower()
+    if not name or name[0].isdigit():
+        name = f"t_{name}"
+    return name
+
+def _files(path: Path) -> tuple[list[Path], str]:
+    """Resuelve archivo o directorio de particiones → (archivos, formato)."""
+    path = Path(path).resolve()
+    if path.is_dir():
+        files = sorted(p for p in path.rglob("*") if p.suffix.lower() in _FORMATS)
+    else:
+        files = [path] if path.exists() else []
+    if not files:
+        raise ValueError(f"No hay archivos Parquet/CSV en {path}")
+    fmts = {_FORMATS[p.suffix.lower()] for p in files}
+    if len(fmts) > 1:
+        raise ValueError(f"Formatos mezclados en {path}: {sorted(fmts)}")
+    return files, fmts.pop()
+
+def _batches(files: list[Path], fmt: str, chunk_rows: int):
+    """Itera record batches de Arrow sin materializar el archivo completo."""
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    for f in files:
+        if fmt == "parquet":
+            yield from pq.ParquetFile(f).iter_batches(batch_size=chunk_rows)
+        else:
+            reader = pacsv.open_csv(
+                f, read_options=pacsv.ReadOptions(block_size=1 << 24))
+            yield from reader
+
+def _schema(files: list[Path], fmt: str):
+    """Esquema Arrow del primer archivo, sin leer filas (sirve aunque no haya datos)."""
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    if fmt == "parquet":
+        return pq.read_schema(files[0])
+    return pacsv.open_csv(files[0]).schema
+
+def _sqlite_type(arrow_type) -> str:
+    import pyarrow.types as pat
+    if pat.is_integer(arrow_type) or pat.is_boolean(arrow_type):
+        return "INTEGER"
+    if pat.is_floating(arrow_type) or pat.is_decimal(arrow_type):
+        return "REAL"
+    return "TEXT"
+
+def _to_sqlite_batch(batch):
+    """Fechas/timestamps → texto ISO (como las tablas semilla); decimales → float."""
+    import pyarrow as pa
+    import pyarrow.types as pat
+    cols = []
+    for col in batch.columns:
+        t = col.type
+        if pat.is_temporal(t):
+            col = col.cast(pa.string())
+        elif pat.is_decimal(t):
+            col = col.cast(pa.float64())
+        cols.append(col)
+    return pa.RecordBatch.from_arrays(cols, names=batch.schema.names)
+
+# =========================================
+# Registro de tablas externas (DuckDB)
+# =========================================
+
+def load_registry() -> dict:
+    if REGISTRY_PATH.exists():
+        return json.loads(REGISTRY_PATH.read_text())
+    return {}
+
+def save_registry(reg: dict):
+    # atómico: los workers del pool lo leen al detectar el cambio de mtime
+    tmp = REGISTRY_PATH.with_name(f"{REGISTRY_PATH.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(reg, ensure_ascii=False, indent=2))
+    os.replace(tmp, REGISTRY_PATH)
+
+def external_dirs() -> list[str]:
+    """Directorios que leen las vistas externas (para `allowed_directories` de DuckDB)."""
+    out = set()
+    for info in load_registry().values():
+        path = Path(re.split(r"[*?\[]", info["glob"], maxsplit=1)[0])
+        out.add(str(path if info["glob"] != str(path) else path.parent))
+    return sorted(out)
+
+def external_view_sql() -> list[str]:
+    """Sentencias CREATE VIEW (DuckDB) para cada archivo externo registrado."""
+    out = []
+    for table, info in load_registry().items():
+        src = info["glob"].replace("'", "''")
+        if info["format"] == "parquet":
+            reader = f"read_parquet('{src}', hive_partitioning = true, union_by_name = true)"
+        else:
+            reader = f"read_csv_auto('{src}', union_by_name = true)"
+        out.append(f"CREATE OR REPLACE VIEW memory.main.{_ident(table)} AS SELECT * FROM {reader}")
+    return out
+
+def register_external(path: str, table: str | None = None) -> dict:
+    """
+    Registra un archivo/directorio para lectura en el lugar desde DuckDB.
+    Devuelve {table, files, format, rows, seconds}.
+    """
+    t0 = time.perf_counter()
+    path = Path(path).resolve()
+    files, fmt = _files(path)
+    name = _table_name(path, table)
+    ext = next(k for k, v in _FORMATS.items() if v == fmt)
+    glob = str(path / "**" / f"*{ext}") if path.is_dir() else str(path)
+
+    reg = load_registry()
+    reg[name] = {"glob": glob, "format": fmt, "registered_at": time.time()}
+    save_registry(reg)
+
+    eng = get_engine("duckdb")
+    eng.reset()  # re-crea las vistas en la próxima consulta
+    rows = eng.row_count(name)
+    return {"table": name, "files": len(files), "format": fmt, "rows": rows,
+            "seconds": time.perf_counter() - t0}
+
+def unregister_external(table: str):
+    reg = load_registry()
+    if reg.pop(table, None) is not None:
+        save_registry(reg)
+        get_engine("duckdb").reset()
+
+# =========================================
+# Carga por lotes en SQLite
+# =========================================
+
+def ingest_file(path: str, table: str | None = None, chunk_rows: int = CHUNK_ROWS,
+                if_exists: str = "replace") -> dict:
+    """
+    Carga un Parquet/CSV (o directorio de particiones) en la DB SQLite por lotes.
+    if_exists: "replace" | "append" | "fail".
+    Devuelve {table, files, format, rows, seconds, rows_per_s}.
+    """
+    ensure_db()
+    t0 = time.perf_counter()
+    path = Path(path).resolve()
+    files, fmt = _files(path)
+    name = _table_name(path, table)
+
+    # esquema antes de tocar la DB: si el archivo no se puede leer, la tabla
+    # existente queda intacta; un archivo sin filas igual crea la tabla
+    schema = _schema(files, fmt)
+    cols = schema.names
+    quoted = ", ".join(_ident(c) for c in cols)
+    marks = ", ".join("?" * len(cols))
+    insert = f"INSERT INTO {_ident(name)} ({quoted}) VALUES ({marks})"
+
+    rows = 0
+    with _conn() as cx:  # una transacción: DROP + CREATE + INSERTs, o nada
+        cur = cx.cursor()
+        cur.execute("BEGIN")
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,))
+        exists = cur.fetchone() is not None
+        if exists and if_exists == "fail":
+            raise ValueError(f"La tabla {name} ya existe")
+        if exists and if_exists == "replace":
+            cur.execute(f"DROP TABLE {_ident(name)}")
+            exists = False
+        if not exists:
+            ddl = ", ".join(f"{_ident(c)} {_sqlite_type(schema.field(c).type)}" for c in cols)
+            cur.execute(f"CREATE TABLE {_ident(name)} ({ddl})")
+
+        for batch in _batches(files, fmt, chunk_rows):
+            batch = _to_sqlite_batch(batch)
+            cur.executemany(insert, zip(*(batch.column(c).to_pylist() for c in cols)))
+            rows += batch.num_rows
+        cx.commit()
+    get_engine("duckdb").reset()  # la copia / attach debe ver la tabla nueva
+
+    secs = time.perf_counter() - t0
+    return {"table": name, "files": len(files), "format": fmt, "rows": rows,
+            "seconds": secs, "rows_per_s": rows / secs if secs else 0.0}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Ingesta Parquet/CSV como tablas consultables")
+    ap.add_argument("path")
+    ap.add_argument("--table")
+    ap.add_argument("--external", action="store_true",
+                    help="leer en el lugar con DuckDB en vez de cargar en SQLite")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = ap.parse_args()
+    if args.external:
+        print(register_external(args.path, args.table))
+    else:
+        print(ingest_file(args.path, args.table, chunk_rows=args.chunk_rows))
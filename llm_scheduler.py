@@ -0,0 +1,183 @@
+"""
+Scheduler compartido para llamadas al LLM.
+
+- Token buckets de requests/min (LLM_RPM) y tokens/min (LLM_TPM); 0 = sin límite.
+- Concurrencia máxima (LLM_MAX_CONCURRENCY).
+- Clases de prioridad: la planificación interactiva pasa antes que el
+  refinamiento, y éste antes que las sugerencias (FIFO dentro de cada clase).
+- Reintentos acotados (LLM_MAX_RETRIES) con backoff exponencial "full jitter",
+  respetando Retry-After si el proveedor lo envía.
+- Métricas de espera en cola por prioridad.
+"""
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+
+PRIORITIES = {"plan": 0, "refine": 1, "suggest": 2}
+
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_CAP_S = float(os.getenv("LLM_BACKOFF_CAP_S", "8"))
+
+
+class TokenBucket:
+    """Bucket por minuto. No es thread-safe: lo protege el lock del scheduler."""
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._t = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def wait_time(self, n: float) -> float:
+        """Segundos hasta poder consumir n (0 si ya se puede)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        n = min(n, self.capacity)  # un pedido más grande que el bucket no debe bloquear para siempre
+        return 0.0 if self.tokens >= n else (n - self.tokens) / self.rate
+
+    def consume(self, n: float):
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(n, self.capacity)
+
+    def adjust(self, delta: float):
+        """Corrige la estimación con el uso real (delta > 0 debita más)."""
+        if not self.unlimited:
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+def _is_retryable(e: Exception) -> bool:
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(e).__name__ in {"RateLimitError", "APIConnectionError", "APITimeoutError"}
+
+
+def _retry_after(e: Exception) -> float | None:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentiles(values, qs=(50, 95, 99)) -> dict:
+    if not values:
+        return {f"p{q}": None for q in qs}
+    xs = sorted(values)
+    return {f"p{q}": round(xs[min(len(xs) - 1, int(len(xs) * q / 100))] * 1000, 1) for q in qs}
+
+
+class LLMScheduler:
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._waits = {p: deque(maxlen=1024) for p in PRIORITIES}
+        self._counters = {"calls": 0, "retries": 0, "failed": 0, "throttled": 0}
+
+    def _acquire(self, stage: str, est_tokens: int) -> float:
+        prio = PRIORITIES.get(stage, max(PRIORITIES.values()))
+        t0 = time.perf_counter()
+        with self._cond:
+            entry = (prio, next(self._seq))
+            heapq.heappush(self._heap, entry)
+            throttled = False
+            while True:
+                if self._heap[0] == entry and self._running < self.max_concurrency:
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(est_tokens))
+                    if wait <= 0:
+                        break
+                    throttled = True
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+            heapq.heappop(self._heap)
+            self.requests.consume(1)
+            self.tokens.consume(est_tokens)
+            self._running += 1
+            if throttled:
+                self._counters["throttled"] += 1
+            waited = time.perf_counter() - t0
+            self._waits.setdefault(stage, deque(maxlen=1024)).append(waited)
+            self._cond.notify_all()  # el nuevo primero de la cola puede avanzar
+        return waited
+
+    def _release(self, est_tokens: int, used_tokens: int | None):
+        with self._cond:
+            self._running -= 1
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - est_tokens)
+            self._cond.notify_all()
+
+    def call(self, stage: str, est_tokens: int, fn):
+        """Ejecuta fn() respetando prioridad, límites y reintentos con jitter."""
+        attempt = 0
+        while True:
+            self._acquire(stage, est_tokens)
+            used = None
+            try:
+                resp = fn()
+                usage = getattr(resp, "usage", None)
+                used = getattr(usage, "total_tokens", None)
+                if used is None and usage is not None:
+                    used = (getattr(usage, "prompt_tokens", 0) or 0) + \
+                           (getattr(usage, "completion_tokens", 0) or 0)
+                with self._cond:
+                    self._counters["calls"] += 1
+                return resp
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    with self._cond:
+                        self._counters["failed"] += 1
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(LLM_BACKOFF_CAP_S,
+                                                  LLM_BACKOFF_BASE_S * 2 ** attempt))
+                attempt += 1
+                with self._cond:
+                    self._counters["retries"] += 1
+            finally:
+                self._release(est_tokens, used)
+            time.sleep(delay)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                **self._counters,
+                "running": self._running,
+                "queued": len(self._heap),
+                "queue_wait_ms": {s: _percentiles(w) for s, w in self._waits.items()},
+            }
+
+
+def estimate_tokens(messages: list[dict], completion_budget: int = 500) -> int:
+    """Estimación gruesa (~4 caracteres por token) + presupuesto de respuesta."""
+    chars = sum(len(str(m.get("content", ""))) for m in messages or [])
+    return chars // 4 + completion_budget
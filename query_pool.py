@@ -0,0 +1,324 @@
+"""
+Pool de procesos para ejecutar SQL aislado del proceso principal.
+
+- Cada worker mantiene conexiones tibias de sólo lectura (SQLite `mode=ro`,
+  DuckDB vía get_engine) y devuelve el resultado como stream Arrow IPC
+  (buffers columnares, una copia por el pipe); si Arrow no puede representar
+  una columna (tipos mezclados de SQLite) cae a pickle protocolo 5.
+- Timeout duro por consulta (QUERY_TIMEOUT_S, contando la espera en cola):
+  vencido, el worker se mata y se reemplaza; la UI y el resto de los hilos no
+  se enteran.
+- Cancelación: cancel(query_id) mata el worker que ejecuta esa consulta, o la
+  saca de la cola si todavía espera un worker libre.
+- Reciclado: un worker se reemplaza tras QUERY_WORKER_MAX_TASKS consultas o si
+  su RSS supera QUERY_WORKER_MAX_MB.
+
+QUERY_POOL_WORKERS=0 desactiva el pool (run_sql ejecuta en el hilo que llama).
+"""
+import atexit
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import signal
+import sys
+import threading
+import time
+import types
+
+import pandas as pd
+
+from tools_sql import QueryCancelledError, QueryTimeoutError
+
+QUERY_POOL_WORKERS = int(os.getenv("QUERY_POOL_WORKERS", "2"))
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", "60"))  # 0 = sin timeout
+QUERY_WORKER_MAX_TASKS = int(os.getenv("QUERY_WORKER_MAX_TASKS", "200"))
+QUERY_WORKER_MAX_MB = float(os.getenv("QUERY_WORKER_MAX_MB", "1024"))
+_POLL_S = 0.05
+
+
+# =========================================
+# Lado worker (proceso hijo)
+# =========================================
+
+def _rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # pico, no actual: fallback fuera de Linux
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1e6 if sys.platform == "darwin" else rss / 1e3
+    except ImportError:
+        return None
+
+
+def _encode(df: pd.DataFrame) -> tuple[str, object]:
+    try:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return "arrow", sink.getvalue()
+    except Exception:
+        return "pickle", pickle.dumps(df, protocol=5)
+
+
+def _decode(fmt: str, payload: bytes) -> pd.DataFrame:
+    if fmt == "arrow":
+        import pyarrow as pa
+        return pa.ipc.open_stream(pa.py_buffer(payload)).read_all().to_pandas()
+    return pickle.loads(payload)
+
+
+def _worker_main(conn, default_engine: str):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C lo maneja el proceso principal
+    import tools_sql
+    engines = {"sqlite": tools_sql.SQLiteEngine(read_only=True)}
+
+    def _engine(name):
+        if name not in engines:
+            engines[name] = tools_sql.get_engine(name)
+        return engines[name]
+
+    try:
+        _engine(default_engine).query("SELECT 1")  # conexión tibia antes del primer pedido
+    except Exception:
+        pass
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg is None:
+            return
+        name, sql = msg
+        try:
+            df = _engine(name).query(sql)
+            stats = df.attrs.pop("exec_stats", {})
+            fmt, payload = _encode(df)
+            conn.send(("ok", fmt, stats, _rss_mb()))
+            conn.send_bytes(payload)
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            conn.send(("error", e, None, _rss_mb()))
+
+
+# =========================================
+# Lado principal
+# =========================================
+
+_START_LOCK = threading.Lock()
+
+
+def _start(proc):
+    # spawn re-ejecuta el __main__ del padre en el hijo; bajo Streamlit eso es
+    # el script de la UI. El worker sólo necesita este módulo: ocultamos __main__.
+    with _START_LOCK:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            proc.start()
+        finally:
+            sys.modules["__main__"] = main
+
+
+class _Worker:
+    def __init__(self, ctx, default_engine: str):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child, default_engine),
+                                daemon=True, name="sql-worker")
+        _start(self.proc)
+        child.close()
+        self.tasks = 0
+        self.rss_mb = None
+        self.cancelled = False
+
+    def kill(self):
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(timeout=1)
+        self.conn.close()
+
+
+class QueryPool:
+    def __init__(self, workers: int = QUERY_POOL_WORKERS, timeout_s: float = QUERY_TIMEOUT_S,
+                 max_tasks: int = QUERY_WORKER_MAX_TASKS, max_mb: float = QUERY_WORKER_MAX_MB):
+        from tools_sql import SQL_ENGINE
+        self._ctx = mp.get_context("spawn")  # sin fork: el proceso principal tiene hilos
+        self._default_engine = SQL_ENGINE
+        self.timeout_s = timeout_s
+        self.max_tasks = max_tasks
+        self.max_mb = max_mb
+        self._idle: queue.Queue = queue.Queue()
+        self._running: dict = {}
+        self._queued: dict = {}  # query_id → cancelada mientras espera un worker
+        self._lock = threading.Lock()
+        self._closed = False
+        self.counts = {"queries": 0, "timeouts": 0, "cancelled": 0, "recycled": 0, "crashed": 0}
+        for _ in range(max(1, workers)):
+            self._idle.put(_Worker(self._ctx, self._default_engine))
+
+    def _replace(self, w: _Worker, reason: str):
+        w.kill()
+        with self._lock:
+            self.counts[reason] += 1
+            if self._closed:
+                return
+        self._idle.put(_Worker(self._ctx, self._default_engine))
+
+    def run(self, engine: str, sql: str, query_id: str | None = None,
+            timeout_s: float | None = None) -> pd.DataFrame:
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        t0 = time.perf_counter()
+        deadline = time.monotonic() + timeout_s if timeout_s else None
+        w = self._acquire(query_id, deadline, timeout_s)
+        # motivo para reemplazar el worker; None = vuelve a la cola. Cualquier
+        # salida no prevista lo reemplaza: el pool nunca pierde workers.
+        reason = "crashed"
+        try:
+            try:
+                w.conn.send((engine, sql))
+            except (OSError, ValueError):
+                raise RuntimeError("El worker SQL terminó inesperadamente") from None
+            while not w.conn.poll(_POLL_S):
+                if deadline and time.monotonic() > deadline:
+                    reason = "timeouts"
+                    raise QueryTimeoutError(f"Consulta abortada: superó {timeout_s:g}s")
+                if not w.proc.is_alive():
+                    break
+            try:
+                status, body, stats, rss = w.conn.recv()
+                payload = w.conn.recv_bytes() if status == "ok" else None
+            except (EOFError, OSError):
+                if w.cancelled:
+                    reason = "cancelled"
+                    raise QueryCancelledError("Consulta cancelada por el usuario") from None
+                raise RuntimeError("El worker SQL terminó inesperadamente") from None
+            reason = None
+            w.tasks += 1
+            w.rss_mb = rss
+        finally:
+            if query_id:
+                with self._lock:
+                    self._running.pop(query_id, None)
+            if reason is None:
+                # cancel() pudo matarlo después de que llegó el resultado
+                if w.cancelled or not w.proc.is_alive():
+                    reason = "cancelled" if w.cancelled else "crashed"
+                elif w.tasks >= self.max_tasks or (rss and rss > self.max_mb):
+                    reason = "recycled"
+            if reason:
+                self._replace(w, reason)
+            else:
+                self._idle.put(w)
+        self._count("queries")
+        if status == "error":
+            raise body
+        df = _decode(body, payload)
+        # cola + transferencia (+ arranque si el worker era nuevo)
+        stats["pool_overhead_ms"] = round(
+            (time.perf_counter() - t0) * 1000 - stats.get("wall_ms", 0), 2)
+        stats["worker_rss_mb"] = round(rss, 1) if rss else None
+        df.attrs["exec_stats"] = stats
+        return df
+
+    def _acquire(self, query_id: str | None, deadline: float | None,
+                 timeout_s: float) -> _Worker:
+        """
+        Toma un worker libre y lo registra en `_running`. La espera en cola es
+        cancelable y cuenta para el timeout de la consulta.
+        """
+        if query_id:
+            with self._lock:
+                self._queued[query_id] = False
+        try:
+            while True:
+                if query_id and self._queued[query_id]:
+                    self._count("cancelled")
+                    raise QueryCancelledError("Consulta cancelada por el usuario")
+                if deadline and time.monotonic() > deadline:
+                    self._count("timeouts")
+                    raise QueryTimeoutError(
+                        f"Consulta abortada: superó {timeout_s:g}s esperando un worker libre")
+                try:
+                    w = self._idle.get(timeout=_POLL_S)
+                except queue.Empty:
+                    continue
+                if not w.proc.is_alive():  # murió estando libre (OOM, kill externo)
+                    self._replace(w, "crashed")
+                    continue
+                w.cancelled = False
+                if not query_id:
+                    return w
+                with self._lock:  # cancel() ve la consulta en cola o corriendo, nunca en el medio
+                    if not self._queued[query_id]:
+                        self._running[query_id] = w
+                        return w
+                self._idle.put(w)
+        finally:
+            if query_id:
+                with self._lock:
+                    self._queued.pop(query_id, None)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def cancel(self, query_id: str) -> bool:
+        with self._lock:
+            if query_id in self._queued:
+                self._queued[query_id] = True  # _acquire lo ve en el próximo poll
+                return True
+            w = self._running.get(query_id)
+            if w is None:
+                return False
+            w.cancelled = True
+        w.proc.kill()  # el hilo que espera ve EOF y reemplaza el worker
+        return True
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self.counts, "running": len(self._running),
+                    "queued": len(self._queued), "idle": self._idle.qsize()}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                w = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                w.conn.send(None)
+            except OSError:
+                pass
+            w.kill()
+
+
+_POOL: QueryPool | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> QueryPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = QueryPool()
+            atexit.register(_POOL.close)
+        return _POOL
+
+
+def cancel(query_id: str) -> bool:
+    return _POOL.cancel(query_id) if _POOL is not None else False
+
+
+def pool_metrics() -> dict | None:
+    return _POOL.metrics() if _POOL is not None else None
@@ -0,0 +1,85 @@
+"""
+Pre-chequeo local (sin LLM) de si una pregunta ya es precisa.
+
+Rasgos: menciona una métrica conocida, un grano/rango temporal o un ranking,
+referencia columnas/tablas del esquema o valores concretos (p.ej. "AR",
+"Electronics"), y no usa términos vagos. Si el puntaje supera el umbral,
+answer() saltea el paso de refinamiento con el LLM.
+"""
+import os
+import re
+import unicodedata
+
+REFINE_SKIP_THRESHOLD = float(os.getenv("REFINE_SKIP_THRESHOLD", "0.75"))
+
+METRIC_TERMS = {
+    "revenue", "ingreso", "ingresos", "facturacion", "ventas", "venta", "unidades",
+    "cantidad", "quantity", "ordenes", "orden", "pedidos", "pedido", "orders",
+    "ticket", "promedio", "precio", "price", "total", "suma", "conteo", "count",
+}
+TIME_PATTERNS = [
+    r"\b(19|20)\d{2}\b", r"\bmes(es)?\b", r"\bmensual(es)?\b", r"\bdiari[oa]s?\b",
+    r"\bsemana(l|s|les)?\b", r"\btrimestr(e|es|al)\b", r"\banual(es)?\b", r"\bano(s)?\b",
+    r"\bultim[oa]s? \d+\b", r"\bq[1-4]\b", r"\bmonth(ly)?\b", r"\byear(ly)?\b",
+    r"\bweek(ly)?\b", r"\bpor dia\b",
+]
+RANKING_PATTERNS = [r"\btop ?\d+\b", r"\bmayor(es)?\b", r"\bmenor(es)?\b", r"\branking\b"]
+VAGUE_TERMS = {
+    "mejor", "mejores", "peor", "peores", "rendimiento", "performance", "como va",
+    "como vamos", "algo", "interesante", "insights", "analisis", "resumen", "tendencias",
+    "bien", "mal", "importante",
+}
+# sinónimos en castellano → nombres del esquema
+SCHEMA_SYNONYMS = {
+    "producto": "products", "productos": "products", "cliente": "customers",
+    "clientes": "customers", "orden": "orders", "ordenes": "orders", "pedidos": "orders",
+    "categoria": "category", "categorias": "category", "pais": "country",
+    "paises": "country", "fecha": "order_date", "precio": "price",
+}
+
+
+def _norm(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def assess_question(question: str, schema: dict, values: dict | None = None,
+                    threshold: float = REFINE_SKIP_THRESHOLD) -> dict:
+    """
+    Devuelve {precise, score, features}. `values` es opcional:
+    {"tabla.columna": [valores frecuentes]} para detectar valores concretos.
+    """
+    q = _norm(question)
+    words = set(re.findall(r"[a-z0-9_]+", q))
+
+    schema_names = {_norm(t) for t in schema}
+    for cols in schema.values():
+        schema_names |= {_norm(c["name"]) for c in cols}
+    mentions = {w for w in words if w in schema_names}
+    mentions |= {SCHEMA_SYNONYMS[w] for w in words if SCHEMA_SYNONYMS.get(w) in schema_names}
+
+    value_hits = set()
+    for col, vals in (values or {}).items():
+        for v in vals:
+            nv = _norm(str(v))
+            if len(nv) >= 2 and re.search(rf"\b{re.escape(nv)}\b", q):
+                value_hits.add(f"{col}={v}")
+
+    features = {
+        "metric": bool(words & METRIC_TERMS),
+        "time": any(re.search(p, q) for p in TIME_PATTERNS),
+        "ranking": any(re.search(p, q) for p in RANKING_PATTERNS),
+        "schema_refs": sorted(mentions),
+        "values": sorted(value_hits),
+        "vague": sorted(t for t in VAGUE_TERMS if re.search(rf"\b{t}\b", q)),
+    }
+    score = (0.35 * features["metric"]
+             + 0.25 * (features["time"] or features["ranking"])
+             + 0.25 * bool(features["schema_refs"])
+             + 0.15 * bool(features["values"] or (features["time"] and features["ranking"])))
+    if features["vague"]:
+        score -= 0.4
+    if len(words) < 3:
+        score -= 0.2
+    score = round(max(0.0, min(1.0, score)), 2)
+    return {"precise": score >= threshold, "score": score, "features": features}
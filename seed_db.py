@@ -2,10 +2,11 @@ import sqlite3, random, datetime, os
 from pathlib import Path
 import pandas as pd
 
-def seed_db(db_path: str | None = None):
+def seed_db(db_path: str | None = None, scale: int = 1):
     """
     Crea y siembra la base toy en db_path (o en env DB_PATH o toy.db).
     Sin side-effects al importar: se ejecuta sólo al llamar explícitamente.
+    `scale` multiplica la cantidad de órdenes (4000 * scale), útil para benchmarks.
     """
     if db_path is None:
         db_path = os.getenv("DB_PATH", "toy.db")
@@ -70,7 +71,7 @@ def seed_db(db_path: str | None = None):
 
     orders = []
     oid = 1
-    for _ in range(4000):
+    for _ in range(4000 * max(1, int(scale))):
         c = random.randint(1,300)
         p = random.randint(1,150)
         q = random.randint(1,5)
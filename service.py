@@ -0,0 +1,337 @@
+"""
+Modo servicio HTTP multi-usuario alrededor de agent_core.
+
+- Pool acotado de workers (SERVICE_WORKERS) + cola de espera (SERVICE_QUEUE).
+  Si la cola está llena se responde 429 con Retry-After (backpressure).
+- Orden por sesión: las tareas de un mismo session_id se ejecutan en FIFO,
+  nunca en paralelo (el historial .session/<id>.json se escribe sin carreras).
+- /story/refresh re-ejecuta sólo las entradas cuyas tablas fuente cambiaron.
+- /health y /metrics para observar throughput, profundidad de cola y latencias.
+
+Uso:
+    python service.py --port 8765 --workers 4 --queue 32
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import agent_core
+import history_index
+import query_pool
+import tools_sql
+from singleflight import coalescing_stats
+
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+SERVICE_QUEUE = int(os.getenv("SERVICE_QUEUE", "32"))
+SERVICE_TIMEOUT_S = float(os.getenv("SERVICE_TIMEOUT_S", "120"))
+
+# session_id termina en una ruta (.session/<id>.json): sólo nombres simples
+_SESSION_RE = re.compile(r"[\w-]{1,64}", re.ASCII)
+_SESSION_ERROR = "session_id inválido o ausente (letras, dígitos, _ o -; máx. 64)"
+
+
+def _valid_session(session_id) -> bool:
+    return isinstance(session_id, str) and _SESSION_RE.fullmatch(session_id) is not None
+
+
+# Topes de los parámetros numéricos de GET (filas de muestra, página de historial)
+TABLE_MAX_ROWS = 100
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def _int_param(qs: dict, name: str, default: int, lo: int = 0, hi: int | None = None) -> int:
+    """Entero de la query string, acotado a [lo, hi]; ValueError si no es un entero."""
+    raw = qs.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ValueError(f"parámetro {name} inválido: {raw!r}") from None
+    return max(lo, min(value, hi)) if hi is not None else max(lo, value)
+
+
+class Overloaded(Exception):
+    """La cola del pool está llena; el cliente debe reintentar más tarde."""
+
+
+def _percentiles(values, qs=(50, 95, 99)) -> dict:
+    if not values:
+        return {f"p{q}": None for q in qs}
+    xs = sorted(values)
+    return {f"p{q}": round(xs[min(len(xs) - 1, int(len(xs) * q / 100))] * 1000, 1) for q in qs}
+
+
+# =========================================
+# Pool de workers con backpressure y orden por sesión
+# =========================================
+
+class WorkerPool:
+    def __init__(self, workers: int = SERVICE_WORKERS, queue_size: int = SERVICE_QUEUE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent")
+        self._lock = threading.Lock()
+        self._sessions: dict = {}   # session_id -> deque de tareas en espera
+        self._pending = 0           # admitidas y no terminadas (en cola + corriendo)
+        self._running = 0
+        self._counters = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._latency = deque(maxlen=2048)
+        self._queue_wait = deque(maxlen=2048)
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_size
+
+    def submit(self, session_id: str | None, fn, *args, **kwargs) -> Future:
+        fut = Future()
+        task = (fut, fn, args, kwargs, time.perf_counter())
+        key = session_id if session_id else object()  # sin sesión → sin orden
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._counters["rejected"] += 1
+                raise Overloaded()
+            self._pending += 1
+            self._counters["accepted"] += 1
+            if key in self._sessions:
+                self._sessions[key].append(task)
+                return fut
+            self._sessions[key] = deque()
+        self._executor.submit(self._run, key, task)
+        return fut
+
+    def _run(self, key, task):
+        fut, fn, args, kwargs, t_submit = task
+        t_start = time.perf_counter()
+        with self._lock:
+            self._running += 1
+            self._queue_wait.append(t_start - t_submit)
+        ok = True
+        if fut.set_running_or_notify_cancel():
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                ok = False
+                fut.set_exception(e)
+        t_end = time.perf_counter()
+        with self._lock:
+            self._running -= 1
+            self._pending -= 1
+            self._latency.append(t_end - t_submit)
+            self._counters["completed" if ok else "failed"] += 1
+            queue = self._sessions[key]
+            nxt = queue.popleft() if queue else None
+            if nxt is None:
+                del self._sessions[key]
+        if nxt is not None:
+            self._executor.submit(self._run, key, nxt)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "active_sessions": len(self._sessions),
+                **self._counters,
+                "latency_ms": _percentiles(self._latency),
+                "queue_wait_ms": _percentiles(self._queue_wait),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# =========================================
+# Serialización
+# =========================================
+
+def serialize_answer(res: dict) -> dict:
+    out = {k: v for k, v in res.items() if k not in ("df", "chart_bytes")}
+    df = res.get("df")
+    if df is not None:
+        out["columns"] = [str(c) for c in df.columns]
+        out["rows"] = json.loads(df.to_json(orient="values", date_format="iso"))
+    else:
+        out["columns"] = out["rows"] = None
+    chart = res.get("chart_bytes")
+    out["chart_png_b64"] = base64.b64encode(chart).decode() if chart else None
+    return out
+
+
+# =========================================
+# HTTP
+# =========================================
+
+class _Handler(BaseHTTPRequestHandler):
+    pool: WorkerPool = None
+    timeout_s: float = SERVICE_TIMEOUT_S
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # silencioso: las métricas cubren esto
+        pass
+
+    def _send(self, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}") if n else {}
+
+    def _dispatch(self, session_id, fn, *args, **kwargs):
+        try:
+            fut = self.pool.submit(session_id, fn, *args, **kwargs)
+        except Overloaded:
+            self._send(429, {"error": "servicio saturado, reintentar"}, {"Retry-After": "1"})
+            return
+        try:
+            self._send(200, fut.result(timeout=self.timeout_s))
+        except FutureTimeout:
+            self._send(504, {"error": "timeout"})
+        except Exception as e:
+            self._send(500, {"error": str(e)})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/health":
+            m = self.pool.metrics()
+            saturated = m["running"] + m["queue_depth"] >= self.pool.capacity
+            self._send(200, {"status": "saturated" if saturated else "ok",
+                             "running": m["running"], "queue_depth": m["queue_depth"]})
+        elif url.path == "/metrics":
+            self._send(200, {**self.pool.metrics(), "coalescing": coalescing_stats(),
+                             "llm_scheduler": agent_core.scheduler.metrics(),
+                             "refinement": agent_core.refinement_metrics(),
+                             "query_pool": query_pool.pool_metrics(),
+                             "caches": {"plans": agent_core.plan_cache_stats(),
+                                        "results": tools_sql.result_cache_stats()}})
+        elif url.path == "/schema":
+            self._dispatch(None, lambda: {"schema": tools_sql.get_schema(),
+                                          "foreign_keys": tools_sql.get_foreign_keys()})
+        elif url.path == "/stats":
+            self._dispatch(None, lambda: {"stats": tools_sql.table_stats()})
+        elif url.path == "/table":
+            try:
+                name, n = qs.get("name", ""), _int_param(qs, "n", 5, hi=TABLE_MAX_ROWS)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            # sólo tablas conocidas: el nombre termina interpolado en SQL
+            if name not in tools_sql.cached_schema():
+                self._send(404, {"error": f"tabla desconocida: {name}"})
+                return
+
+            def _table():
+                df = tools_sql.sample_rows(name, n)
+                stats = tools_sql.table_stats().get(name)
+                return {"row_count": stats["row_count"] if stats else tools_sql.table_row_count(name),
+                        "columns": [str(c) for c in df.columns],
+                        "rows": json.loads(df.to_json(orient="values", date_format="iso"))}
+            self._dispatch(None, _table)
+        elif url.path == "/history/search":
+            try:
+                page = _int_param(qs, "page", 0)
+                page_size = _int_param(qs, "page_size", 20, lo=1, hi=HISTORY_MAX_PAGE_SIZE)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            rows, total = history_index.search(
+                qs.get("q", ""), session_id=qs.get("session_id") or None,
+                page=page, page_size=page_size)
+            self._send(200, {"rows": rows, "total": total})
+        elif url.path == "/history":
+            if not _valid_session(qs.get("session_id")):
+                self._send(400, {"error": _SESSION_ERROR})
+                return
+            self._send(200, {"history": agent_core.load_session(qs["session_id"])})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            body = self._body()
+        except ValueError:
+            self._send(400, {"error": "JSON inválido"})
+            return
+        sid = body.get("session_id")
+        if self.path in ("/answer", "/refine", "/story/refresh") and not _valid_session(sid):
+            self._send(400, {"error": _SESSION_ERROR})
+            return
+        if self.path == "/answer":
+            self._dispatch(sid, lambda: serialize_answer(agent_core.answer(
+                body["question"], session_id=sid,
+                auto_use_refined=body.get("auto_use_refined", True),
+                query_id=body.get("query_id"))))
+        elif self.path == "/cancel":
+            # fuera del pool: tiene que responder aunque los workers estén ocupados
+            self._send(200, {"cancelled": tools_sql.cancel_query(body.get("query_id", ""))})
+        elif self.path == "/refine":
+            self._dispatch(sid, lambda: agent_core.refine_question_step(
+                base_question=body["base_question"],
+                schema=body.get("schema") or tools_sql.get_schema(),
+                session_id=sid,
+                user_selected_clarifications=body.get("user_selected_clarifications"),
+                user_edited_question=body.get("user_edited_question")))
+        elif self.path == "/history/entries":
+            self._send(200, {"entries": history_index.get_entries(body.get("ids") or [])})
+        elif self.path == "/story/refresh":
+            self._dispatch(sid, agent_core.refresh_story, sid, indices=body.get("indices"))
+        elif self.path == "/suggest":
+            self._dispatch(None, lambda: {"suggestions": agent_core.suggest_questions(
+                body.get("schema") or tools_sql.get_schema(), partial=body.get("partial"),
+                k=body.get("k", 5))})
+        else:
+            self._send(404, {"error": "not found"})
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765,
+                workers: int = SERVICE_WORKERS, queue_size: int = SERVICE_QUEUE,
+                timeout_s: float = SERVICE_TIMEOUT_S) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"pool": WorkerPool(workers, queue_size),
+                                            "timeout_s": timeout_s})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.pool = handler.pool
+    return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Servicio HTTP del agente")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    ap.add_argument("--queue", type=int, default=SERVICE_QUEUE)
+    ap.add_argument("--no-warmup", action="store_true",
+                    help="no precargar esquema, conexiones ni preguntas frecuentes")
+    args = ap.parse_args()
+    tools_sql.ensure_db()
+    if not args.no_warmup:
+        from warmup import format_report, warmup
+        print(format_report(warmup()))
+    srv = make_server(args.host, args.port, args.workers, args.queue)
+    print(f"Sirviendo en http://{args.host}:{args.port} "
+          f"(workers={args.workers}, queue={args.queue})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        srv.pool.shutdown()
@@ -0,0 +1,68 @@
+"""
+Single-flight: coalescing de trabajo idéntico en vuelo.
+
+Si varios hilos piden la misma clave mientras la primera ejecución sigue en
+curso, sólo el primero (líder) ejecuta; el resto espera y recibe el mismo
+resultado (o la misma excepción, salvo las de `retry_on`). No es un cache: al
+terminar, la clave se libera.
+"""
+import threading
+from concurrent.futures import Future
+
+_REGISTRY: dict = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self.calls = 0
+        self.executions = 0
+        self.shared = 0
+        _REGISTRY[name] = self
+
+    def do(self, key, fn, retry_on: tuple = ()):
+        """
+        Ejecuta fn() una sola vez por clave en vuelo. Devuelve (valor, compartido).
+        Si el líder falla con una excepción de `retry_on` (p.ej. lo cancelaron),
+        sus seguidores no la heredan: vuelven a intentar y uno pasa a ser líder.
+        """
+        with self._lock:
+            self.calls += 1
+        while True:
+            with self._lock:
+                fut = self._inflight.get(key)
+                leader = fut is None
+                if leader:
+                    fut = Future()
+                    self._inflight[key] = fut
+                    self.executions += 1
+                else:
+                    self.shared += 1
+            if not leader:
+                try:
+                    return fut.result(), True
+                except retry_on:
+                    continue
+            try:
+                value = fn()
+            except BaseException as e:
+                fut.set_exception(e)
+                raise
+            else:
+                fut.set_result(value)
+                return value, False
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "executions": self.executions,
+                    "shared": self.shared, "in_flight": len(self._inflight)}
+
+
+def coalescing_stats() -> dict:
+    """{capa: {calls, executions, shared, in_flight}} de todas las instancias."""
+    return {name: sf.stats() for name, sf in _REGISTRY.items()}
@@ -1,11 +1,19 @@
+import contextlib
+import hashlib
+import json
 import os
 import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 import pandas as pd
-from sqlglot import parse_one, exp
+from sqlglot import parse_one, exp, transpile
 from sqlglot.errors import ParseError
 
+from singleflight import SingleFlight
+
 # =========================================
 # Config y helpers de conexión / semilla
 # =========================================
@@ -17,8 +25,8 @@ DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 ROW_LIMIT = int(os.getenv("ROW_LIMIT", "1000"))
 
-def _conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+def _conn(db_path: Path | None = None):
+    return sqlite3.connect(db_path or DB_PATH, check_same_thread=False)
 
 def _tables_present() -> set[str]:
     with _conn() as cx:
@@ -26,26 +34,371 @@ def _tables_present() -> set[str]:
         cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
         return {r[0] for r in cur.fetchall()}
 
+_SEED_LOCK = threading.Lock()
+
 def ensure_db():
     """
     Crea/siembra la DB si no existe o si faltan tablas clave.
     Usa seed_db.seed_db(DB_PATH) sin side-effects (seed_db refactorizado).
+    Serializado con un lock: varios hilos pueden llegar a la vez al primer pedido.
     """
-    must_seed = not DB_PATH.exists()
-    needed = {"customers", "products", "orders"}
-    if not must_seed:
-        # Si existe el archivo, verificamos tablas requeridas
-        try:
-            present = _tables_present()
-            if not needed.issubset(present):
+    with _SEED_LOCK:
+        must_seed = not DB_PATH.exists()
+        needed = {"customers", "products", "orders"}
+        if not must_seed:
+            # Si existe el archivo, verificamos tablas requeridas
+            try:
+                present = _tables_present()
+                if not needed.issubset(present):
+                    must_seed = True
+            except Exception:
                 must_seed = True
-        except Exception:
-            must_seed = True
 
-    if must_seed:
-        # Import tardío para evitar side-effects
-        from seed_db import seed_db as _seed
-        _seed(str(DB_PATH))
+        if must_seed:
+            # Import tardío para evitar side-effects
+            from seed_db import seed_db as _seed
+            _seed(str(DB_PATH))
+
+# =========================================
+# Motores de ejecución (SQLite / DuckDB)
+# =========================================
+
+# Motor por defecto: "sqlite" (histórico) o "duckdb" (columnar, multi-hilo).
+SQL_ENGINE = os.getenv("SQL_ENGINE", "sqlite").lower()
+# DuckDB puede adjuntar el archivo SQLite ("attach", requiere la extensión
+# sqlite de DuckDB) o trabajar sobre una copia convertida ("copy").
+DUCKDB_MODE = os.getenv("DUCKDB_MODE", "attach").lower()
+DUCKDB_PATH = Path(os.getenv("DUCKDB_PATH", str(DB_PATH.with_suffix(".duckdb")))).resolve()
+
+
+# Presupuestos por consulta (0 = sin límite de pasos)
+QUERY_MAX_VM_STEPS = int(os.getenv("QUERY_MAX_VM_STEPS", "0"))
+RESULT_MAX_MB = float(os.getenv("RESULT_MAX_MB", "512"))
+RESULT_CHUNK_ROWS = int(os.getenv("RESULT_CHUNK_ROWS", "50000"))
+PROGRESS_STEP = 1000  # el progress handler se invoca cada N instrucciones de la VM
+
+
+class ResourceLimitError(ValueError):
+    """La consulta superó el presupuesto de pasos de VM o de memoria del resultado."""
+
+
+class QueryTimeoutError(ResourceLimitError):
+    """La consulta superó QUERY_TIMEOUT_S en el pool de procesos (el worker se mató)."""
+
+
+class QueryCancelledError(RuntimeError):
+    """La consulta fue cancelada por el usuario (cancel_query)."""
+
+
+def _collect_with_budget(chunks) -> pd.DataFrame:
+    """Concatena chunks abortando apenas el resultado supera RESULT_MAX_MB."""
+    parts, size = [], 0
+    for chunk in chunks:
+        size += int(chunk.memory_usage(deep=True).sum())
+        if size > RESULT_MAX_MB * 1024 * 1024:
+            raise ResourceLimitError(f"Resultado supera el presupuesto de {RESULT_MAX_MB:g} MB")
+        parts.append(chunk)
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+
+def _exec_stats(engine: str, df: pd.DataFrame, t0: float, vm_steps: int | None) -> dict:
+    return {
+        "engine": engine,
+        "wall_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "vm_steps": vm_steps,
+        "rows": len(df),
+        "result_bytes": int(df.memory_usage(deep=True).sum()),
+    }
+
+
+def _is_internal(table: str) -> bool:
+    # Tablas auxiliares (muestras, catálogos) empiezan con "_": no se exponen al LLM.
+    return table.startswith("_")
+
+def _ident(name: str) -> str:
+    """Identificador entre comillas dobles (válido en SQLite y DuckDB)."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _file_versions(*paths) -> tuple:
+    """(mtime_ns, tamaño) por archivo, None si no existe: huella barata (sólo stat)."""
+    out = []
+    for p in paths:
+        try:
+            st = Path(p).stat()
+            out.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+@contextlib.contextmanager
+def _file_lock(path: Path):
+    """Lock exclusivo entre procesos (flock); sin fcntl (Windows) no bloquea."""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _ensure(db_path: Path):
+    # Sólo la DB por defecto se siembra sola; otras rutas (benchmarks) ya existen.
+    if Path(db_path) == DB_PATH:
+        ensure_db()
+
+
+class SQLiteEngine:
+    """Motor original: consultas directas contra el archivo SQLite."""
+    name = "sqlite"
+    dialect = "sqlite"
+
+    def __init__(self, db_path: Path = DB_PATH, read_only: bool = False):
+        self.db_path = Path(db_path)
+        # read_only: una conexión tibia `mode=ro` reutilizada entre consultas
+        # (la usan los workers de query_pool, un hilo por proceso).
+        self.read_only = read_only
+        self._cx = None
+
+    def _query_conn(self):
+        if not self.read_only:
+            return _conn(self.db_path)
+        if self._cx is None:
+            self._cx = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                       check_same_thread=False)
+        return self._cx
+
+    def tables(self) -> list[str]:
+        _ensure(self.db_path)
+        with _conn(self.db_path) as cx:
+            cur = cx.cursor()
+            cur.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+            return [r[0] for r in cur.fetchall() if not _is_internal(r[0])]
+
+    def columns(self, table: str) -> list[dict]:
+        _ensure(self.db_path)
+        with _conn(self.db_path) as cx:
+            cur = cx.cursor()
+            cur.execute(f"PRAGMA table_info({_ident(table)})")
+            return [{"name": c[1], "type": c[2]} for c in cur.fetchall()]
+
+    def row_count(self, table: str) -> int:
+        _ensure(self.db_path)
+        with _conn(self.db_path) as cx:
+            cur = cx.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM {_ident(table)}")
+            return cur.fetchone()[0]
+
+    def query(self, sql: str) -> pd.DataFrame:
+        _ensure(self.db_path)
+        steps = [0]
+
+        def _progress():
+            steps[0] += PROGRESS_STEP
+            return 1 if QUERY_MAX_VM_STEPS and steps[0] > QUERY_MAX_VM_STEPS else 0
+
+        t0 = time.perf_counter()
+        with self._query_conn() as cx:
+            cx.set_progress_handler(_progress, PROGRESS_STEP)
+            try:
+                df = _collect_with_budget(pd.read_sql_query(sql, cx, chunksize=RESULT_CHUNK_ROWS))
+            except Exception as e:
+                if "interrupted" in str(e):
+                    raise ResourceLimitError(
+                        f"Consulta abortada: superó {QUERY_MAX_VM_STEPS} pasos de la VM de SQLite")
+                raise
+            finally:
+                cx.set_progress_handler(None, 0)
+        df.attrs["exec_stats"] = _exec_stats(self.name, df, t0, steps[0])
+        return df
+
+    def iter_query(self, sql: str, chunk_rows: int = RESULT_CHUNK_ROWS):
+        """Resultado por chunks, sin materializarlo (exportaciones)."""
+        _ensure(self.db_path)
+        cx = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            yield from pd.read_sql_query(sql, cx, chunksize=chunk_rows)
+        finally:
+            cx.close()
+
+
+class DuckDBEngine:
+    """
+    Motor DuckDB embebido. Lee la misma DB SQLite, ya sea adjuntándola
+    (extensión sqlite de DuckDB) o desde una copia .duckdb que se regenera
+    cuando el archivo SQLite es más nuevo que la copia. Además expone como
+    vistas los archivos Parquet/CSV registrados con `ingest.register_external`.
+
+    Cada cursor compara el mtime del archivo SQLite y del registro de tablas
+    externas con los de la conexión abierta: si otro proceso escribió (ingesta,
+    ETL, register_external) se re-conecta, así el attach ve las tablas nuevas,
+    la copia se regenera y las vistas se re-crean. Vale también para los
+    workers de query_pool, que tienen su propia instancia.
+    """
+    name = "duckdb"
+    dialect = "duckdb"
+
+    def __init__(self, db_path: Path = DB_PATH, mode: str = DUCKDB_MODE,
+                 copy_path: Path = DUCKDB_PATH):
+        self.db_path = Path(db_path)
+        self.mode = mode
+        self.copy_path = Path(copy_path)
+        self._cx = None
+        self._source = None
+        self._lock = threading.Lock()
+
+    def _source_version(self):
+        """Huella barata del origen: cambia con cada commit en el SQLite o en el registro."""
+        from ingest import REGISTRY_PATH  # tardío: ingest importa este módulo
+        return _file_versions(self.db_path, REGISTRY_PATH)
+
+    def _connect(self):
+        import duckdb  # import tardío: dependencia sólo para este motor
+        _ensure(self.db_path)
+        cx = duckdb.connect(":memory:")
+        attached = False
+        if self.mode == "attach":
+            try:
+                cx.execute("INSTALL sqlite; LOAD sqlite;")
+                cx.execute(f"ATTACH '{self.db_path}' AS src (TYPE sqlite, READ_ONLY)")
+                attached = True
+            except Exception:
+                # sin extensión (p.ej. entorno offline) → copia convertida
+                self.mode = "copy"
+        if not attached:
+            self._refresh_copy()
+            cx.execute(f"ATTACH '{self.copy_path}' AS src (READ_ONLY)")
+        # Archivos externos (Parquet/CSV) registrados vía ingest: vistas en memoria
+        # que leen en el lugar, sin copiar filas.
+        from ingest import external_dirs, external_view_sql
+        for view_sql in external_view_sql():
+            cx.execute(view_sql)
+        # Blindaje: el SQL generado no puede leer/escribir otros archivos del host
+        # (read_text, COPY ... TO, ATTACH) ni cambiar la configuración después.
+        dirs = [str(self.db_path.parent)] + external_dirs()
+        allowed = ", ".join("'" + d.rstrip("/").replace("'", "''") + "/'" for d in dirs)
+        cx.execute(f"SET allowed_directories = [{allowed}]")
+        cx.execute("SET enable_external_access = false")
+        cx.execute("SET lock_configuration = true")
+        return cx
+
+    def _copy_fresh(self) -> bool:
+        return (self.copy_path.exists()
+                and self.copy_path.stat().st_mtime >= self.db_path.stat().st_mtime)
+
+    def _refresh_copy(self):
+        """Convierte las tablas SQLite a un archivo DuckDB si está desactualizado."""
+        import duckdb
+        if self._copy_fresh():
+            return
+        # Varios procesos (UI, servicio, workers del pool) pueden llegar a la vez:
+        # uno convierte y el resto espera el lock y encuentra la copia al día.
+        with _file_lock(self.copy_path.with_name(self.copy_path.name + ".lock")):
+            if self._copy_fresh():
+                return
+            tmp = self.copy_path.with_name(
+                f"{self.copy_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                with _conn(self.db_path) as src:
+                    tables = [r[0] for r in src.execute(
+                        "SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+                    dst = duckdb.connect(str(tmp))
+                    try:
+                        for t in tables:
+                            try:
+                                df = pd.read_sql_query(f"SELECT * FROM {_ident(t)}", src)
+                            except pd.errors.DatabaseError:
+                                continue  # la borraron a mitad de conversión (el DROP re-dispara)
+                            dst.register("_src_df", df)
+                            dst.execute(f'CREATE TABLE {_ident(t)} AS SELECT * FROM _src_df')
+                            dst.unregister("_src_df")
+                    finally:
+                        dst.close()
+                os.replace(tmp, self.copy_path)
+            finally:
+                tmp.unlink(missing_ok=True)
+
+    def _cursor(self):
+        with self._lock:
+            source = self._source_version()
+            if self._cx is not None and source != self._source:
+                self._cx = None  # el SQLite cambió desde el attach / la copia
+            if self._cx is None:
+                self._cx = self._connect()
+                self._source = source
+            # cursor() = conexión hija, segura para usar desde otro hilo;
+            # no hereda settings de sesión, así que fijamos el search_path acá.
+            cur = self._cx.cursor()
+        cur.execute("SET search_path = 'src.main,memory.main'")
+        return cur
+
+    def reset(self):
+        """
+        Suelta la conexión para forzar re-attach / re-conversión. No la cierra:
+        los cursores ya entregados comparten la instancia y terminan sus consultas
+        sobre ella; se libera con el último cursor.
+        """
+        with self._lock:
+            self._cx = None
+
+    def tables(self) -> list[str]:
+        cur = self._cursor()
+        rows = cur.execute(
+            "SELECT DISTINCT table_name FROM information_schema.tables "
+            "WHERE table_catalog IN ('src', 'memory') AND table_schema = 'main' "
+            "ORDER BY table_name").fetchall()
+        return [r[0] for r in rows if not _is_internal(r[0])]
+
+    def columns(self, table: str) -> list[dict]:
+        cur = self._cursor()
+        # 'src' > 'memory': misma precedencia que el search_path
+        rows = cur.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_catalog = (SELECT max(table_catalog) FROM information_schema.columns "
+            "  WHERE table_catalog IN ('src', 'memory') AND table_schema = 'main' AND table_name = ?) "
+            "AND table_schema = 'main' AND table_name = ? ORDER BY ordinal_position",
+            [table, table]).fetchall()
+        return [{"name": r[0], "type": r[1]} for r in rows]
+
+    def row_count(self, table: str) -> int:
+        return self._cursor().execute(f'SELECT COUNT(*) FROM {_ident(table)}').fetchone()[0]
+
+    def query(self, sql: str) -> pd.DataFrame:
+        t0 = time.perf_counter()
+        reader = self._cursor().execute(sql).fetch_record_batch(RESULT_CHUNK_ROWS)
+        batches, size = [], 0
+        for batch in reader:
+            size += batch.nbytes
+            if size > RESULT_MAX_MB * 1024 * 1024:
+                raise ResourceLimitError(f"Resultado supera el presupuesto de {RESULT_MAX_MB:g} MB")
+            batches.append(batch)
+        import pyarrow as pa
+        df = pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+        df.attrs["exec_stats"] = _exec_stats(self.name, df, t0, None)
+        return df
+
+    def iter_query(self, sql: str, chunk_rows: int = RESULT_CHUNK_ROWS):
+        """Resultado por chunks, sin materializarlo (exportaciones)."""
+        for batch in self._cursor().execute(sql).fetch_record_batch(chunk_rows):
+            yield batch.to_pandas()
+
+
+_ENGINE_CLASSES = {"sqlite": SQLiteEngine, "duckdb": DuckDBEngine}
+_ENGINES: dict = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_engine(name: str | None = None):
+    """Devuelve (y cachea) la instancia del motor pedido o del configurado."""
+    name = (name or SQL_ENGINE).lower()
+    if name not in _ENGINE_CLASSES:
+        raise ValueError(f"Motor SQL desconocido: {name}")
+    with _ENGINES_LOCK:
+        if name not in _ENGINES:
+            _ENGINES[name] = _ENGINE_CLASSES[name]()
+        return _ENGINES[name]
 
 # =========================================
 # Esquema / info
@@ -68,37 +421,35 @@ def get_foreign_keys():
                 pass
     return rels
 
-def table_row_count(table: str) -> int:
-    ensure_db()
-    with _conn() as cx:
-        cur = cx.cursor()
-        try:
-            cur.execute(f"SELECT COUNT(*) FROM {table}")
-            n = cur.fetchone()[0]
-        except Exception:
-            n = 0
-    return n
+def table_row_count(table: str, engine: str | None = None) -> int:
+    try:
+        return get_engine(engine).row_count(table)
+    except Exception:
+        return 0
 
-def sample_rows(table: str, n: int = 5):
-    ensure_db()
-    with _conn() as cx:
-        df = pd.read_sql_query(f"SELECT * FROM {table} LIMIT {n}", cx)
-    return df
+def sample_rows(table: str, n: int = 5, engine: str | None = None):
+    return get_engine(engine).query(f"SELECT * FROM {_ident(table)} LIMIT {int(n)}")
 
-def get_schema():
+def get_schema(engine: str | None = None):
     """
-    Devuelve un dict {tabla: [{name, type}, ...]} usando PRAGMA table_info.
+    Devuelve un dict {tabla: [{name, type}, ...]} según el motor activo
+    (PRAGMA table_info en SQLite, information_schema en DuckDB).
     """
-    ensure_db()
-    schema = {}
-    with _conn() as cx:
-        cur = cx.cursor()
-        cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        tables = [r[0] for r in cur.fetchall()]
-        for t in tables:
-            cur.execute(f"PRAGMA table_info({t})")
-            cols = [{"name": c[1], "type": c[2]} for c in cur.fetchall()]
-            schema[t] = cols
+    eng = get_engine(engine)
+    return {t: eng.columns(t) for t in eng.tables()}
+
+_SCHEMA_CACHE: dict = {}
+
+def cached_schema(engine: str | None = None) -> dict:
+    """get_schema cacheado por motor; se recalcula cuando cambia la DB o el registro."""
+    eng = get_engine(engine)
+    from ingest import REGISTRY_PATH  # tardío: ingest importa este módulo
+    token = _file_versions(DB_PATH, REGISTRY_PATH)
+    hit = _SCHEMA_CACHE.get(eng.name)
+    if hit and hit[0] == token:
+        return hit[1]
+    schema = get_schema(eng.name)
+    _SCHEMA_CACHE[eng.name] = (token, schema)
     return schema
 
 # =========================================
@@ -140,6 +491,7 @@ def _forbidden_nodes_tuple():
         "Command",      # PRAGMA, VACUUM, etc.
         "Attach", "Detach",
         "Analyze", "Reindex",
+        "Copy", "Set",  # DuckDB: COPY ... TO archivo, SET de configuración
     ]
     nodes = []
     for name in names:
@@ -152,31 +504,608 @@ def _forbidden_nodes_tuple():
 # Validación y ejecución
 # =========================================
 
-def validate_sql(sql: str, debug: bool = False) -> str:
-    sql = sanitize(sql)
-    if ";" in sql:
-        raise ValueError("Una sola sentencia permitida")
+# Funciones escalares con efectos fuera de la DB (archivos, extensiones, entorno).
+_FORBIDDEN_FUNCS = {"load_extension", "readfile", "writefile", "getenv", "edit"}
 
+def _check_tree(sql: str, dialect: str):
     try:
-        tree = parse_one(sql, read="sqlite")
+        tree = parse_one(sql, read=dialect)
     except ParseError as e:
         raise ValueError(f"SQL inválido: {e}")
 
     forbidden_nodes = _forbidden_nodes_tuple()
-    if any(tree.find(n) for n in forbidden_nodes):
+    if not isinstance(tree, exp.Query) or any(tree.find(n) for n in forbidden_nodes):
         raise ValueError("Operación no permitida")
+    # Funciones de tabla en FROM/JOIN (read_csv, read_text, glob, json_each...):
+    # en DuckDB leen archivos o URLs del host.
+    if any(isinstance(t.this, exp.Func) for t in tree.find_all(exp.Table)):
+        raise ValueError("Funciones de tabla no permitidas")
+    for fn in tree.find_all(exp.Func):
+        name = (fn.name if isinstance(fn, exp.Anonymous) else fn.sql_name()).lower()
+        if name in _FORBIDDEN_FUNCS or name.startswith("read_"):
+            raise ValueError(f"Función no permitida: {name}")
+    return tree
 
+def validate_sql(sql: str, debug: bool = False) -> str:
+    sql = sanitize(sql)
+    if ";" in sql:
+        raise ValueError("Una sola sentencia permitida")
+    _check_tree(sql, "sqlite")
     return sql
 
+def transpile_sql(sql: str, dialect: str) -> str:
+    """
+    Traduce SQL (ya validado, dialecto SQLite) al dialecto del motor y
+    vuelve a aplicar las mismas reglas de nodos prohibidos sobre el resultado.
+    """
+    if dialect == "sqlite":
+        return sql
+    try:
+        out = transpile(sql, read="sqlite", write=dialect)[0]
+    except ParseError as e:
+        raise ValueError(f"SQL inválido: {e}")
+    _check_tree(out, dialect)
+    return out
+
 def enforce_limit(sql: str) -> str:
     if re.search(r"\bLIMIT\b", sql, re.IGNORECASE):
         return sql
     return f"{sql.strip()} LIMIT {ROW_LIMIT}"
 
-def run_sql(sql: str) -> pd.DataFrame:
-    ensure_db()
+# =========================================
+# Ejecución aproximada sobre muestras
+# =========================================
+
+# Fracción de la muestra uniforme (Bernoulli) y tamaño mínimo de tabla para muestrear.
+SAMPLE_RATE = float(os.getenv("SAMPLE_RATE", "0.01"))
+APPROX_MIN_ROWS = int(os.getenv("APPROX_MIN_ROWS", "100000"))
+APPROX_Z = 1.96  # IC 95%
+
+def _sample_name(table: str) -> str:
+    return f"_sample_{table}"
+
+def refresh_samples(rate: float = SAMPLE_RATE, min_rows: int = APPROX_MIN_ROWS) -> dict:
+    """
+    Crea/actualiza las tablas de muestra `_sample_<tabla>` para tablas grandes.
+    Una muestra se reconstruye cuando cambia la versión de la tabla base
+    (`_table_versions`: cualquier INSERT/UPDATE/DELETE) o la tasa.
+    Devuelve {tabla: tasa} de las muestras vigentes.
+    """
+    versions = table_versions()
+    with _conn() as cx:
+        cur = cx.cursor()
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS _sample_meta ("
+            " table_name TEXT PRIMARY KEY, rate REAL, base_version INTEGER, built_at REAL)")
+        cols = {r[1] for r in cur.execute("PRAGMA table_info(_sample_meta)").fetchall()}
+        if "base_version" not in cols:  # meta vieja (keyed por max(rowid)): se descarta
+            cur.execute("DROP TABLE _sample_meta")
+            cur.execute(
+                "CREATE TABLE _sample_meta ("
+                " table_name TEXT PRIMARY KEY, rate REAL, base_version INTEGER, built_at REAL)")
+        meta = {r[0]: (r[1], r[2]) for r in cur.execute(
+            "SELECT table_name, rate, base_version FROM _sample_meta").fetchall()}
+        out = {}
+        for t, version in versions.items():
+            try:
+                max_rowid = cur.execute(f'SELECT max(rowid) FROM {_ident(t)}').fetchone()[0] or 0
+            except sqlite3.OperationalError:  # WITHOUT ROWID o tabla ya borrada
+                continue
+            if max_rowid < min_rows:
+                continue
+            if meta.get(t) != (rate, version):
+                threshold = int(rate * 1_000_000)
+                cur.execute(f"DROP TABLE IF EXISTS {_ident(_sample_name(t))}")
+                cur.execute(
+                    f"CREATE TABLE {_ident(_sample_name(t))} AS SELECT * FROM {_ident(t)} "
+                    f"WHERE (abs(random()) % 1000000) < {threshold}")
+                cur.execute(
+                    "INSERT OR REPLACE INTO _sample_meta VALUES (?, ?, ?, ?)",
+                    (t, rate, version, time.time()))
+            out[t] = rate
+        cx.commit()
+    return out
+
+def rewrite_for_sample(sql: str, samples: dict) -> tuple[str, dict] | None:
+    """
+    Reescribe SQL (ya validado, dialecto SQLite) para leer la muestra de su tabla
+    grande, escalando SUM/COUNT por 1/tasa (salvo en cocientes entre agregados)
+    y agregando columnas auxiliares (suma de cuadrados) para el error estándar.
+    Devuelve (sql, info) o None si la consulta no es aproximable (subconsultas,
+    CTEs, ventanas, COUNT DISTINCT, más de una tabla muestreada, sin agregados).
+    """
+    tree = parse_one(sql, read="sqlite")
+    selects = list(tree.find_all(exp.Select))
+    if len(selects) != 1 or not isinstance(tree, exp.Select):
+        return None
+    if tree.find(exp.Window) or any(isinstance(c.this, exp.Distinct)
+                                    for c in tree.find_all(exp.Count)):
+        return None
+    refs = [t for t in tree.find_all(exp.Table) if t.name in samples]
+    if len(refs) != 1:
+        return None
+    if not tree.find(exp.AggFunc) or tree.find(exp.Min, exp.Max):
+        return None  # sin agregados no hay nada que estimar; MIN/MAX quedan sesgados
+
+    ref = refs[0]
+    base = ref.name
+    rate = samples[base]
+    scale = 1.0 / rate
+    if not ref.alias:
+        ref.set("alias", exp.TableAlias(this=exp.to_identifier(base)))
+    ref.set("this", exp.to_identifier(_sample_name(base)))
+
+    # columnas auxiliares: Σx² por agregado proyectado (Var HT = (1-p)/p² Σx²)
+    bounds, names, aux = {}, {}, []
+    for i, p in enumerate(tree.expressions):
+        inner = p.this if isinstance(p, exp.Alias) else p
+        if isinstance(inner, (exp.Sum, exp.Count)):
+            name = p.alias if isinstance(p, exp.Alias) else inner.sql("sqlite")
+            if not isinstance(p, exp.Alias):
+                names[i] = name  # mantener el nombre de columna original
+            sq = f"__sq_{i}"
+            if isinstance(inner, exp.Sum):
+                arg = exp.Paren(this=inner.this.copy())
+                sq_expr = exp.Sum(this=exp.Mul(this=arg, expression=arg.copy()))
+            else:
+                sq_expr = inner.copy()
+            bounds[name] = sq
+            aux.append(exp.alias_(sq_expr, sq))
+
+    # Cocientes de agregados (SUM(a)/SUM(b), SUM(x)/COUNT(*)) no dependen de la
+    # tasa: se dejan sin escalar para que den lo mismo que la consulta exacta.
+    ratio = {id(n) for d in tree.find_all(exp.Div)
+             if d.this.find(exp.AggFunc) and d.expression.find(exp.AggFunc)
+             for n in d.find_all(exp.Sum, exp.Count)}
+    for node in list(tree.find_all(exp.Sum, exp.Count)):
+        if id(node) not in ratio:
+            node.replace(exp.Paren(this=exp.Mul(this=node.copy(),
+                                                expression=exp.Literal.number(scale))))
+    projections = [exp.alias_(e, names[i], quoted=True) if i in names else e
+                   for i, e in enumerate(tree.expressions)]
+    tree.set("expressions", projections + aux)
+
+    info = {"table": base, "sample_rate": rate, "z": APPROX_Z, "bounds": bounds}
+    return tree.sql("sqlite"), info
+
+def run_sql_approx(sql: str, engine: str | None = None) -> pd.DataFrame | None:
+    """
+    Ejecución aproximada: corre la consulta sobre la muestra uniforme y devuelve
+    el DataFrame con SUM/COUNT escalados y columnas `<col>_err` (semiancho del
+    IC 95%). La metadata queda en `df.attrs["approx"]`. None si no aplica.
+    """
+    eng = get_engine(engine)
     sql = validate_sql(sql)
+    samples = refresh_samples()
+    if not samples:
+        return None
+    rewritten = rewrite_for_sample(sql, samples)
+    if rewritten is None:
+        return None
+    sql, info = rewritten
     sql = enforce_limit(sql)
-    with _conn() as cx:
-        df = pd.read_sql_query(sql, cx)
+    source_sql = sql
+    sql = transpile_sql(sql, eng.dialect)
+    df = eng.query(sql)
+
+    p = info["sample_rate"]
+    for col, sq in info["bounds"].items():
+        if col in df.columns:
+            var = (1 - p) / (p * p) * pd.to_numeric(df[sq], errors="coerce")
+            df[f"{col}_err"] = APPROX_Z * var.pow(0.5)
+    df = df.drop(columns=[c for c in df.columns if str(c).startswith("__sq_")])
+    if OPTIMIZE_DTYPES:
+        df = optimize_dtypes(df, source_sql, cached_schema(eng.name))
+    df.attrs["approx"] = info
     return df
+
+# =========================================
+# Tipado de resultados (dtypes)
+# =========================================
+
+OPTIMIZE_DTYPES = os.getenv("OPTIMIZE_DTYPES", "1") == "1"
+CATEGORY_MAX_RATIO = 0.5     # nunique / filas
+CATEGORY_MIN_ROWS = 32       # en resultados chicos no vale la pena
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
+_ISO_PERIOD = re.compile(r"^\d{4}-(\d{2}|W\d{2}|Q[1-4])$")
+
+def _column_sources(sql: str) -> dict:
+    """{columna_resultado: columna_origen} para proyecciones que son columnas simples."""
+    try:
+        tree = parse_one(sql, read="sqlite")
+    except ParseError:
+        return {}
+    if not isinstance(tree, exp.Select):
+        return {}
+    out = {}
+    for p in tree.expressions:
+        inner = p.this if isinstance(p, exp.Alias) else p
+        if isinstance(inner, exp.Column):
+            out[p.alias_or_name] = inner.name
+    return out
+
+def _declared_types(schema: dict | None) -> dict:
+    types = {}
+    for cols in (schema or {}).values():
+        for c in cols:
+            types.setdefault(c["name"], (c.get("type") or "").upper())
+    return types
+
+def optimize_dtypes(df: pd.DataFrame, sql: str | None = None,
+                    schema: dict | None = None) -> pd.DataFrame:
+    """
+    Tipa el resultado una sola vez al traerlo:
+    - texto ISO (YYYY-MM-DD[ hh:mm[:ss]]) → datetime64
+    - períodos ISO (YYYY-MM, YYYY-Www, YYYY-Qn) → categórica ordenada
+    - texto de baja cardinalidad → category
+    - enteros → el entero más chico que alcance (los float no se achican:
+      float32 perdería centavos en montos)
+    El esquema declarado evita inspeccionar columnas que vienen de una columna
+    numérica o de texto no-fecha; las expresiones (strftime, CASE...) se inspeccionan.
+    """
+    if df.empty:
+        return df
+    sources = _column_sources(sql) if sql else {}
+    declared = _declared_types(schema)
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_integer_dtype(s):
+            out[col] = pd.to_numeric(s, downcast="integer")
+            continue
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            continue
+        src = sources.get(col)
+        src_type = declared.get(src, "") if src else ""
+        non_null = s.dropna()
+        if non_null.empty or not all(isinstance(v, str) for v in non_null.head(100)):
+            continue
+        maybe_time = not src or "date" in src.lower() or "time" in src.lower() \
+            or "DATE" in src_type or "TIME" in src_type
+        probe = non_null.head(100)
+        if maybe_time and probe.str.match(_ISO_DATE).all():
+            parsed = pd.to_datetime(s, format="ISO8601", errors="coerce")
+            if parsed.notna().sum() == len(non_null):
+                out[col] = parsed
+                continue
+        if maybe_time and probe.str.match(_ISO_PERIOD).all() and non_null.str.match(_ISO_PERIOD).all():
+            out[col] = pd.Categorical(s, categories=sorted(non_null.unique()), ordered=True)
+            continue
+        n_unique = non_null.nunique()
+        if len(s) >= CATEGORY_MIN_ROWS and n_unique <= CATEGORY_MAX_RATIO * len(s):
+            out[col] = s.astype("category")
+    if not out:
+        return df
+    typed = df.copy(deep=False)
+    for k, v in out.items():
+        typed[k] = v
+    typed.attrs = dict(df.attrs)
+    return typed
+
+_sql_flight = SingleFlight("sql")
+
+def _query(eng, sql: str, query_id: str | None = None) -> pd.DataFrame:
+    import query_pool  # tardío: query_pool importa este módulo
+    # Sólo los motores por defecto pasan por el pool; instancias con otra ruta
+    # (benchmarks) siguen en el hilo que llama.
+    if query_pool.QUERY_POOL_WORKERS and _ENGINES.get(eng.name) is eng:
+        return query_pool.get_pool().run(eng.name, sql, query_id)
+    return eng.query(sql)
+
+def cancel_query(query_id: str) -> bool:
+    """Cancela una consulta del pool (en curso o esperando worker); True si la encontró."""
+    import query_pool
+    return query_pool.cancel(query_id)
+
+def _fetch(eng, sql: str, source_sql: str, query_id: str | None = None) -> pd.DataFrame:
+    """Ejecuta en el motor y tipa el resultado (source_sql: SQL en dialecto SQLite)."""
+    df = _query(eng, sql, query_id)
+    if OPTIMIZE_DTYPES:
+        raw = df.attrs.get("exec_stats", {}).get("result_bytes")
+        df = optimize_dtypes(df, source_sql, cached_schema(eng.name))
+        stats = df.attrs.get("exec_stats")
+        if stats is not None:
+            stats["result_bytes_raw"] = raw
+            stats["result_bytes"] = int(df.memory_usage(deep=True).sum())
+    return df
+
+def iter_sql(sql: str, engine: str | None = None, chunk_rows: int = RESULT_CHUNK_ROWS):
+    """
+    Mismas reglas que run_sql (validación, LIMIT, transpilación) pero entrega
+    el resultado por chunks en el hilo que llama, para escribirlo a disco sin
+    tenerlo entero en memoria.
+    """
+    eng = get_engine(engine)
+    sql = transpile_sql(enforce_limit(validate_sql(sql)), eng.dialect)
+    yield from eng.iter_query(sql, chunk_rows)
+
+# Cache de resultados: (motor, sql) → df, válido mientras no cambie la versión de
+# ninguna tabla fuente (_table_versions). Consultas sobre tablas sin seguimiento
+# (externas) o con funciones volátiles (fecha actual, random) no se cachean. LRU acotado por RESULT_CACHE_MB (0 = desactivado).
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "64"))
+_result_cache: OrderedDict = OrderedDict()
+_result_cache_lock = threading.Lock()
+_result_cache_stats = {"hits": 0, "misses": 0, "bytes": 0}
+
+# Funciones cuyo resultado cambia sin que cambien los datos: esas consultas no se
+# cachean. Además, cualquier literal 'now' (date('now'), strftime('%Y', 'now'), ...).
+_VOLATILE_NODES = tuple(c for c in (getattr(exp, n, None) for n in (
+    "CurrentDate", "CurrentTime", "CurrentTimestamp", "CurrentDatetime",
+    "Rand", "Randn", "Uuid")) if c is not None)
+_VOLATILE_FUNCS = {"random", "randomblob", "unixepoch", "changes", "total_changes",
+                   "last_insert_rowid"}
+
+def _is_volatile(sql: str) -> bool:
+    tree = parse_one(sql, read="sqlite")
+    if _VOLATILE_NODES and tree.find(*_VOLATILE_NODES):
+        return True
+    if any(f.name.lower() in _VOLATILE_FUNCS for f in tree.find_all(exp.Anonymous)):
+        return True
+    return any(lit.is_string and lit.this.strip().lower() == "now"
+               for lit in tree.find_all(exp.Literal))
+
+def _cache_versions(source_sql: str) -> tuple | None:
+    try:
+        if _is_volatile(source_sql):
+            return None
+        versions = table_versions(sql_tables(source_sql))
+    except Exception:
+        return None
+    if not versions or any(v is None for v in versions.values()):
+        return None
+    return tuple(sorted(versions.items()))
+
+def _cache_get(key, versions) -> pd.DataFrame | None:
+    with _result_cache_lock:
+        item = _result_cache.get(key)
+        if item is None or item[0] != versions:
+            _result_cache_stats["misses"] += 1
+            return None
+        _result_cache.move_to_end(key)
+        _result_cache_stats["hits"] += 1
+        df = item[1].copy()
+    df.attrs["exec_stats"] = {**df.attrs.get("exec_stats", {}), "cache_hit": True}
+    return df
+
+def _cache_put(key, versions, df: pd.DataFrame):
+    size = int(df.memory_usage(deep=True).sum())
+    limit = RESULT_CACHE_MB * 1024 * 1024
+    if size > limit / 4:  # resultados enormes no desalojan a todo el resto
+        return
+    with _result_cache_lock:
+        old = _result_cache.pop(key, None)
+        if old is not None:
+            _result_cache_stats["bytes"] -= old[2]
+        _result_cache[key] = (versions, df, size)
+        _result_cache_stats["bytes"] += size
+        while _result_cache_stats["bytes"] > limit:
+            _k, (_v, _df, sz) = _result_cache.popitem(last=False)
+            _result_cache_stats["bytes"] -= sz
+
+def result_cache_stats() -> dict:
+    with _result_cache_lock:
+        return {**_result_cache_stats, "entries": len(_result_cache)}
+
+def run_sql(sql: str, engine: str | None = None, query_id: str | None = None) -> pd.DataFrame:
+    """
+    Valida, limita, transpila y ejecuta. Con el pool de procesos activo
+    (`query_pool`), `query_id` permite cancelar la ejecución vía cancel_query;
+    si se coalesció con otra en vuelo, sólo el query_id del líder es cancelable.
+    """
+    eng = get_engine(engine)
+    sql = validate_sql(sql)
+    sql = enforce_limit(sql)
+    source_sql = sql
+    sql = transpile_sql(sql, eng.dialect)
+    # versiones leídas antes de ejecutar: conservador ante escrituras concurrentes
+    versions = _cache_versions(source_sql) if RESULT_CACHE_MB else None
+    if versions:
+        cached = _cache_get((eng.name, sql), versions)
+        if cached is not None:
+            return cached
+    # misma SQL validada en vuelo → una sola ejecución; cada seguidor recibe su copia
+    # si cancelan al líder, los que esperaban su resultado re-ejecutan la consulta
+    df, shared = _sql_flight.do((eng.name, sql), lambda: _fetch(eng, sql, source_sql, query_id),
+                                retry_on=(QueryCancelledError,))
+    if versions and not shared:
+        _cache_put((eng.name, sql), versions, df)
+        return df.copy()
+    return df.copy() if shared else df
+
+# =========================================
+# Versionado de datos (cambios por tabla)
+# =========================================
+
+def ensure_change_tracking() -> list[str]:
+    """
+    Instala triggers que incrementan `_table_versions.version` ante cada
+    INSERT/UPDATE/DELETE. Tablas sin trigger (nuevas o recreadas, p.ej. por
+    seed_db o ingest) se registran con un salto de versión. Devuelve las tablas
+    recién instrumentadas.
+    """
+    ensure_db()
+    with _conn() as cx:
+        cur = cx.cursor()
+        cur.execute("CREATE TABLE IF NOT EXISTS _table_versions ("
+                    " table_name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        rows = cur.execute("SELECT type, name, tbl_name FROM sqlite_master "
+                           "WHERE type IN ('table', 'trigger')").fetchall()
+        tables = [n for t, n, _ in rows if t == "table" and not _is_internal(n)
+                  and not n.startswith("sqlite_")]
+        tracked = {tbl for t, n, tbl in rows if t == "trigger" and n.startswith("_tv_")}
+        new = [t for t in tables if t not in tracked]
+        for t in new:
+            for op in ("INSERT", "UPDATE", "DELETE"):
+                cur.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS "_tv_{t}_{op.lower()}" AFTER {op} ON "{t}" '
+                    f"BEGIN UPDATE _table_versions SET version = version + 1 "
+                    f"WHERE table_name = '{t}'; END")
+            cur.execute("INSERT INTO _table_versions VALUES (?, 1) "
+                        "ON CONFLICT(table_name) DO UPDATE SET version = version + 1", (t,))
+        cx.commit()
+    return new
+
+def table_versions(tables: list[str] | None = None) -> dict:
+    """{tabla: versión}; tablas sin seguimiento (p.ej. externas) → None."""
+    ensure_change_tracking()
+    with _conn() as cx:
+        known = dict(cx.execute("SELECT table_name, version FROM _table_versions").fetchall())
+    if tables is None:
+        return known
+    return {t: known.get(t) for t in tables}
+
+def sql_tables(sql: str) -> list[str]:
+    """Tablas base referenciadas por una consulta (excluye CTEs)."""
+    tree = parse_one(sanitize(sql), read="sqlite")
+    ctes = {c.alias_or_name for c in tree.find_all(exp.CTE)}
+    return sorted({t.name for t in tree.find_all(exp.Table)} - ctes)
+
+def result_digest(df: pd.DataFrame) -> str:
+    """Huella estable del resultado (columnas + valores, sin índice)."""
+    h = hashlib.sha256("\x1f".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()[:16]
+
+# =========================================
+# Catálogo de estadísticas por columna
+# =========================================
+
+STATS_TOP_K = int(os.getenv("STATS_TOP_K", "30"))        # valores frecuentes por columna de texto
+STATS_SAMPLE_ROWS = int(os.getenv("STATS_SAMPLE_ROWS", "5"))
+_STATS_LOCK = threading.Lock()
+_stats_cache: dict = {}
+
+
+def _is_text(ctype: str) -> bool:
+    ctype = (ctype or "").upper()
+    return not ctype or "CHAR" in ctype or "TEXT" in ctype or "CLOB" in ctype
+
+
+def _ensure_stats_tables(cx):
+    cx.execute("CREATE TABLE IF NOT EXISTS _table_stats ("
+               " table_name TEXT PRIMARY KEY, version INTEGER, row_count INTEGER,"
+               " sample TEXT, refreshed_at REAL)")
+    cx.execute("CREATE TABLE IF NOT EXISTS _column_stats ("
+               " table_name TEXT, column_name TEXT, position INTEGER, type TEXT,"
+               " non_null INTEGER, distinct_count INTEGER, min_value, max_value,"
+               " top_values TEXT, PRIMARY KEY (table_name, column_name))")
+
+
+def _compute_stats(cx, table: str) -> tuple[int, list[tuple], str]:
+    """Una pasada de agregados por tabla + GROUP BY acotado para columnas de texto."""
+    cols = cx.execute(f'PRAGMA table_info("{table}")').fetchall()
+    aggs = ", ".join(f'COUNT("{c[1]}"), COUNT(DISTINCT "{c[1]}"), MIN("{c[1]}"), MAX("{c[1]}")'
+                     for c in cols)
+    row = cx.execute(f'SELECT COUNT(*), {aggs} FROM "{table}"').fetchone()
+    n, rest = row[0], row[1:]
+    out = []
+    for i, (_cid, col, ctype, *_x) in enumerate(cols):
+        non_null, distinct, lo, hi = rest[4 * i: 4 * i + 4]
+        top = None
+        if _is_text(ctype) and distinct:
+            top = cx.execute(f'SELECT "{col}", COUNT(*) AS n FROM "{table}" WHERE "{col}" IS NOT NULL '
+                             f'GROUP BY "{col}" ORDER BY n DESC LIMIT {STATS_TOP_K}').fetchall()
+            top = json.dumps([list(r) for r in top], ensure_ascii=False, default=str)
+        out.append((table, col, i, ctype, non_null, distinct, lo, hi, top))
+    cur = cx.execute(f'SELECT * FROM "{table}" LIMIT {STATS_SAMPLE_ROWS}')
+    names = [d[0] for d in cur.description]
+    sample = json.dumps([dict(zip(names, r)) for r in cur.fetchall()],
+                        ensure_ascii=False, default=str)
+    return n, out, sample
+
+
+def refresh_stats(tables: list[str] | None = None, force: bool = False) -> list[str]:
+    """
+    Recalcula el catálogo sólo para las tablas cuya versión (`_table_versions`)
+    cambió desde el último cálculo; borra entradas de tablas que ya no existen.
+    Devuelve las tablas recalculadas.
+    """
+    versions = table_versions()
+    with _STATS_LOCK, _conn() as cx:
+        _ensure_stats_tables(cx)
+        present = {r[0] for r in cx.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        stored = dict(cx.execute("SELECT table_name, version FROM _table_stats").fetchall())
+        for gone in set(stored) - present:
+            cx.execute("DELETE FROM _table_stats WHERE table_name = ?", (gone,))
+            cx.execute("DELETE FROM _column_stats WHERE table_name = ?", (gone,))
+        todo = [t for t in (tables or versions) if t in present and t in versions
+                and (force or stored.get(t) != versions[t])]
+        for t in todo:
+            n, cols, sample = _compute_stats(cx, t)
+            cx.execute("DELETE FROM _column_stats WHERE table_name = ?", (t,))
+            cx.executemany("INSERT INTO _column_stats VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", cols)
+            cx.execute("INSERT OR REPLACE INTO _table_stats VALUES (?, ?, ?, ?, ?)",
+                       (t, versions[t], n, sample, time.time()))
+        cx.commit()
+    return todo
+
+
+def table_stats() -> dict:
+    """
+    {tabla: {row_count, version, refreshed_at, sample: [filas], columns: {col: {...}}}}
+    leído del catálogo. Si ninguna versión cambió, sale del cache en memoria
+    (una sola consulta chica a `_table_versions`); si cambió, refresca sólo lo stale.
+    Sólo incluye tablas de la DB SQLite: las vistas externas de DuckDB (ingest
+    --external) no tienen versión; para ellas usar table_row_count / sample_rows.
+    """
+    versions = table_versions()
+    key = tuple(sorted(versions.items()))
+    if key in _stats_cache:
+        return _stats_cache[key]
+    refresh_stats()
+    out = {}
+    with _conn() as cx:
+        for t, v, n, sample, ts in cx.execute("SELECT * FROM _table_stats ORDER BY table_name"):
+            out[t] = {"row_count": n, "version": v, "refreshed_at": ts,
+                      "sample": json.loads(sample or "[]"), "columns": {}}
+        for t, col, _pos, ctype, non_null, distinct, lo, hi, top in cx.execute(
+                "SELECT * FROM _column_stats ORDER BY table_name, position"):
+            if t not in out:
+                continue
+            n = out[t]["row_count"] or 0
+            out[t]["columns"][col] = {
+                "type": ctype, "distinct": distinct, "min": lo, "max": hi,
+                "null_rate": round(1 - non_null / n, 4) if n else 0.0,
+                "top_values": json.loads(top) if top else [],
+            }
+    _stats_cache.clear()
+    _stats_cache[key] = out
+    return out
+
+
+def low_cardinality_values(max_distinct: int = 30) -> dict:
+    """
+    {"tabla.columna": [valores]} para columnas de texto con pocos valores
+    distintos (p.ej. country, category), tomado del catálogo de estadísticas.
+    """
+    out = {}
+    for t, ts in table_stats().items():
+        for col, cs in ts["columns"].items():
+            vals = cs["top_values"]
+            if vals and cs["distinct"] <= min(max_distinct, STATS_TOP_K):
+                out[f"{t}.{col}"] = [v for v, _n in vals]
+    return out
+
+
+def stats_prompt(max_values: int = 12) -> str:
+    """
+    Resumen compacto para el prompt del planner: filas por tabla, rangos reales
+    (fechas incluidas) y valores de columnas categóricas.
+    """
+    lines = []
+    for t, ts in table_stats().items():
+        parts = []
+        for col, cs in ts["columns"].items():
+            if cs["distinct"] == 0:
+                continue
+            vals = cs["top_values"]
+            if vals and cs["distinct"] <= max_values:
+                parts.append(f"{col} ∈ {{{', '.join(str(v) for v, _n in vals)}}}")
+            elif vals and not _ISO_DATE.match(str(cs["min"])):
+                parts.append(f"{col}: {cs['distinct']} distintos")
+            else:
+                parts.append(f"{col}: {cs['min']}..{cs['max']}")
+            if cs["null_rate"]:
+                parts[-1] += f" ({cs['null_rate']:.0%} nulos)"
+        lines.append(f"- {t} ({ts['row_count']} filas): " + "; ".join(parts))
+    return "\n".join(lines)
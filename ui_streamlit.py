@@ -1,20 +1,40 @@
 import os
 import uuid
 import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
 
-from agent_core import (
-    answer,
-    load_session,
-    refine_question_step,    # refinamiento iterativo
-    suggest_questions        # preguntas sugeridas (opcional)
-)
-from tools_sql import ensure_db, get_schema, get_foreign_keys, table_row_count, sample_rows
+load_dotenv()
+if os.getenv("AGENT_API_URL"):
+    # cliente delgado: el trabajo corre en service.py (pool + backpressure)
+    from api_client import (
+        answer,
+        get_entries,
+        search_history,
+        refine_question_step,
+        refresh_story,
+        suggest_questions,
+        ensure_db, get_schema, get_foreign_keys, table_stats, cancel_query,
+        table_row_count, sample_rows,
+    )
+else:
+    from agent_core import (
+        answer,
+        refine_question_step,    # refinamiento iterativo
+        refresh_story,           # re-ejecuta sólo lo que cambió
+        suggest_questions        # preguntas sugeridas (opcional)
+    )
+    from tools_sql import (
+        ensure_db, get_schema, get_foreign_keys, table_stats, cancel_query,
+        table_row_count, sample_rows,
+    )
+    from history_index import search as search_history, get_entries
+from exports import FORMATS, export_df, export_result, export_story, mime, story_markdown
 ensure_db()  # ← crea/siembra si hace falta (deploys en la nube)
 
 # ============ Config ============
-load_dotenv()
 st.set_page_config(page_title="Data Analyst Agent", layout="wide")
 
 # ============ Estado ============
@@ -28,6 +48,36 @@ if "results" not in st.session_state:
 if "refine" not in st.session_state:
     st.session_state["refine"] = None      # estado del refinamiento iterativo
 
+STORY_PAGE_SIZE = 20
+
+
+@st.cache_resource
+def _answer_pool():
+    # compartido entre reruns: la consulta sigue viva aunque el script se re-ejecute
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="answer")
+
+
+@st.cache_resource
+def _startup_warmup():
+    """Warm-up una vez por proceso, en segundo plano: la primera página no lo espera."""
+    from warmup import warmup
+    return _answer_pool().submit(warmup)
+
+
+if not os.getenv("AGENT_API_URL"):  # en modo cliente el warm-up lo hace service.py
+    _startup_warmup()
+
+
+def _start_answer(question: str):
+    """Lanza answer en segundo plano; el bloque de ejecución espera y permite cancelar."""
+    qid = uuid.uuid4().hex
+    st.session_state["running"] = {
+        "question": question, "query_id": qid, "t0": time.time(),
+        "future": _answer_pool().submit(
+            answer, question, session_id=st.session_state["session_id"],
+            progressive=st.session_state.get("use_approx", False), query_id=qid),
+    }
+
 # ============ Utils: diagrama ============
 
 
@@ -62,46 +112,93 @@ def _cached_schema():
 # ============ Sidebar: Storytelling + Preferencias ============
 with st.sidebar:
     st.header("🧵 Storytelling")
-    disk_history = load_session(st.session_state["session_id"])
     if "story" not in st.session_state:
-        st.session_state["story"] = []
-
-    # Checkboxes estables para marcar tarjetas
-    for idx, item in enumerate(disk_history):
-        label = (item.get("question") or "(sin pregunta)")[:60]
-        checked = idx in st.session_state["story"]
-        if st.checkbox(label, value=checked, key=f"pick_{idx}"):
-            if idx not in st.session_state["story"]:
-                st.session_state["story"].append(idx)
+        st.session_state["story"] = []     # ids "<session_id>:<idx>"
+    if "story_page" not in st.session_state:
+        st.session_state["story_page"] = 0
+
+    # Búsqueda paginada sobre el índice: sólo se renderiza la página visible
+    search_q = st.text_input("🔎 Buscar en historial", key="story_search")
+    all_sessions = st.toggle("Todas las sesiones", value=False, key="story_all")
+    if (search_q, all_sessions) != st.session_state.get("story_filter"):
+        st.session_state["story_filter"] = (search_q, all_sessions)
+        st.session_state["story_page"] = 0
+    page = st.session_state["story_page"]
+    rows, total = search_history(
+        search_q,
+        session_id=None if all_sessions else st.session_state["session_id"],
+        page=page, page_size=STORY_PAGE_SIZE)
+
+    # Checkboxes estables para marcar tarjetas (key por id de entrada)
+    for row in rows:
+        eid = row["id"]
+        label = (row.get("question") or "(sin pregunta)")[:60]
+        checked = eid in st.session_state["story"]
+        if st.checkbox(label, value=checked, key=f"pick_{eid}"):
+            if eid not in st.session_state["story"]:
+                st.session_state["story"].append(eid)
         else:
-            if idx in st.session_state["story"]:
-                st.session_state["story"].remove(idx)
+            if eid in st.session_state["story"]:
+                st.session_state["story"].remove(eid)
+
+    n_pages = max(1, -(-total // STORY_PAGE_SIZE))
+    p1, p2, p3 = st.columns([1, 2, 1])
+    if p1.button("◀", key="story_prev", disabled=page == 0):
+        st.session_state["story_page"] = page - 1
+        st.rerun()
+    p2.caption(f"Página {page + 1}/{n_pages} · {total} entradas · "
+               f"{len(st.session_state['story'])} marcadas")
+    if p3.button("▶", key="story_next", disabled=page + 1 >= n_pages):
+        st.session_state["story_page"] = page + 1
+        st.rerun()
 
-    # Exportar selección
+    # Exportar selección (por id, sin cargar sesiones completas)
     if st.button("📝 Exportar Story (Markdown)", key="export_story_btn"):
-        md = ["# Story - Data Analyst Agent\n"]
-        for idx in st.session_state["story"]:
-            it = disk_history[idx]
-            md += [
-                f"## {it.get('question', '')}",
-                "```sql",
-                it.get("sql", ""),
-                "```",
-                it.get("plan", {}).get("explain", ""),
-                ""
-            ]
+        md = story_markdown(get_entries(st.session_state["story"]))
         st.download_button(
             "Descargar Story.md",
-            data="\n".join(md).encode(),
+            data=md.encode(),
             file_name="story.md",
             mime="text/markdown",
             key="dl_story"
         )
+    if not os.getenv("AGENT_API_URL"):
+        # zip con story.md + resultados (datos actuales) + charts; re-usa el cache de exports
+        story_fmt = st.selectbox("Formato de los datos", list(FORMATS), key="story_fmt")
+        if st.button("📦 Exportar Story (zip)", key="export_story_zip_btn"):
+            with st.spinner("Armando el paquete..."):
+                path = export_story(get_entries(st.session_state["story"]), story_fmt)
+            st.download_button(
+                "Descargar story.zip",
+                data=path.read_bytes(),
+                file_name="story.zip",
+                mime="application/zip",
+                key="dl_story_zip"
+            )
+
+    # Refrescar: sólo re-ejecuta entradas cuyas tablas cambiaron
+    if st.button("🔄 Refrescar Story", key="refresh_story_btn"):
+        by_session = {}
+        for eid in st.session_state["story"]:
+            sid, idx = eid.rsplit(":", 1)
+            by_session.setdefault(sid, []).append(int(idx))
+        if not by_session:
+            by_session = {st.session_state["session_id"]: None}
+        agg = {"refreshed": 0, "unchanged": 0, "changed_results": 0, "seconds": 0.0}
+        with st.spinner("Verificando cambios en los datos..."):
+            for sid, idxs in by_session.items():
+                rep = refresh_story(sid, indices=idxs)
+                for k in ("refreshed", "unchanged", "changed_results"):
+                    agg[k] += len(rep[k])
+                agg["seconds"] += rep["seconds"]
+        st.caption(
+            f"Re-ejecutadas: {agg['refreshed']} · sin cambios: {agg['unchanged']} · "
+            f"resultados distintos: {agg['changed_results']} ({agg['seconds']:.1f}s)")
 
     # Limpiar selección
     if st.button("🧹 Limpiar Story", key="clear_story_btn"):
-        for idx in range(len(disk_history)):
-            st.session_state.pop(f"pick_{idx}", None)
+        for key in [k for k in st.session_state if str(k).startswith("pick_")]:
+            st.session_state.pop(key, None)
         st.session_state["story"] = []
         st.rerun()
 
@@ -110,6 +207,29 @@ with st.sidebar:
     # Toggle: activar/desactivar bloque de sugerencias
     st.toggle("💡 Usar 'Preguntas sugeridas'",
               value=False, key="use_suggestions")
+    if not os.getenv("AGENT_API_URL"):
+        st.toggle("🎲 Respuesta aproximada primero (tablas grandes)",
+                  value=False, key="use_approx",
+                  help="Muestra enseguida un resultado sobre una muestra (~1%) "
+                       "y lo reemplaza por el exacto cuando termina.")
+        with st.expander("🔥 Warm-up", expanded=False):
+            fut = _startup_warmup()
+            if not fut.done():
+                st.caption("En curso...")
+            else:
+                for r in fut.result():
+                    st.caption(f"{'✅' if r['ok'] else '⚠️'} **{r['step']}** "
+                               f"{r['ms']:.0f} ms · {r['detail']}")
+        with st.expander("📈 Trabajo ahorrado", expanded=False):
+            from singleflight import coalescing_stats
+            for layer, c in coalescing_stats().items():
+                st.caption(f"**{layer}**: {c['shared']} de {c['calls']} pedidos compartidos")
+            from agent_core import refinement_metrics
+            rm = refinement_metrics()
+            if rm["skip_rate"] is not None:
+                st.caption(f"**refine**: {rm['skipped']} salteados ({rm['skip_rate']:.0%}), "
+                           f"{rm['skipped_failed']} fallaron luego, "
+                           f"~{(rm['est_saved_ms'] or 0) / 1000:.1f}s ahorrados")
 
 # ============ Título & Esquema visual ============
 st.title("🧠📊 Innovation HUB - Asistente")
@@ -123,17 +243,35 @@ with st.expander("🔎 Esquema de la base (visual y navegable)", expanded=False)
         st.graphviz_chart(build_schema_dot(schema, fks),
                           use_container_width=True)
 
+    # catálogo de estadísticas: se recalcula sólo cuando cambian los datos.
+    # Sólo cubre tablas SQLite: las vistas externas de DuckDB van al motor.
+    stats = table_stats()
+
     with tab2:
         for t, cols in schema.items():
-            n = table_row_count(t)
+            ts = stats.get(t, {})
+            n = ts["row_count"] if ts else table_row_count(t)
             with st.expander(f"**{t}** — {n} filas"):
-                st.table([{"columna": c["name"], "tipo": c["type"]}
-                         for c in cols])
+                rows = []
+                for c in cols:
+                    cs = ts.get("columns", {}).get(c["name"], {})
+                    rows.append({
+                        "columna": c["name"], "tipo": c["type"],
+                        "distintos": cs.get("distinct"),
+                        "% nulos": f"{cs['null_rate']:.1%}" if "null_rate" in cs else None,
+                        # texto: la columna mezcla números, fechas y strings
+                        "mín": str(cs.get("min", "")), "máx": str(cs.get("max", "")),
+                        "top": ", ".join(str(v) for v, _n in cs.get("top_values", [])[:3]),
+                    })
+                st.table(rows)
 
     with tab3:
         for t in schema.keys():
             with st.expander(f"Preview: {t} (5 filas)"):
-                st.dataframe(sample_rows(t, 5))
+                if t in stats:
+                    st.dataframe(pd.DataFrame(stats[t]["sample"]))
+                else:
+                    st.dataframe(sample_rows(t, 5))
 
 # Pre-cargar esquema para todos los bloques
 schema_cached, _ = _cached_schema()
@@ -167,11 +305,7 @@ if st.session_state.get("trigger_exec_from_suggestion"):
     st.session_state.pop("trigger_exec_from_suggestion", None)
     dq = (st.session_state.get("direct_q") or "").strip()
     if dq:
-        with st.spinner("⚡ Ejecutando la pregunta seleccionada..."):
-            res = answer(dq, session_id=st.session_state["session_id"])
-            # anclamos un ts para keys estables en la UI
-            res["ts"] = res.get("ts", time.time())
-            st.session_state["results"].append(res)
+        _start_answer(dq)
         st.rerun()
 
 # ============ Preguntas sugeridas (opcional) ============
@@ -269,11 +403,7 @@ if st.session_state["refine"]:
         st.rerun()
 
     if c2.button("✅ Ejecutar ahora", key=f"exec_now_{len(R['steps'])}"):
-        with st.spinner("Generando SQL y ejecutando..."):
-            res = answer(
-                R["current"], session_id=st.session_state["session_id"])
-            res["ts"] = res.get("ts", time.time())
-            st.session_state["results"].append(res)
+        _start_answer(R["current"])
         st.session_state["refine"] = None
         st.rerun()
 
@@ -305,13 +435,106 @@ q = st.text_input(
     "Preguntale a la base (ej: ventas por categoría por mes):", "", key="direct_q")
 run = st.button("Ejecutar", type="primary", key="direct_run_btn")
 
-if run and q.strip():
-    with st.spinner("Pensando y consultando..."):
-        res = answer(q, session_id=st.session_state["session_id"])
+if run and q.strip() and not st.session_state.get("running"):
+    _start_answer(q)
+
+running = st.session_state.get("running")
+if running:
+    status = st.empty()
+    if st.button("⛔ Cancelar consulta", key="cancel_query_btn"):
+        # si todavía no llegó al SQL (LLM), dejamos de esperar y se descarta el resultado
+        cancel_query(running["query_id"])
+        running["cancelled"] = True
+    # Espera con polling: cada actualización de `status` es un punto donde
+    # Streamlit corta el run si el usuario tocó "Cancelar".
+    while not running.get("cancelled") and not running["future"].done():
+        status.info(f"⏳ Pensando y consultando... {time.time() - running['t0']:.0f}s")
+        time.sleep(0.25)
+    st.session_state.pop("running", None)
+    if running["future"].done():
+        res = running["future"].result()
+        # anclamos un ts para keys estables en la UI
         res["ts"] = res.get("ts", time.time())
+        res["query_id"] = running["query_id"]  # la ejecución exacta sigue cancelable
         st.session_state["results"].append(res)
+        status.empty()
+    else:
+        status.warning(f"Consulta cancelada: {running['question']}")
 
 # ============ Render de resultados ============
+
+
+def _adopt_exact(res: dict):
+    """Reemplaza el resultado aproximado por el exacto (in-place, persiste en session_state)."""
+    exact = res.pop("exact_future").result()
+    res.pop("query_id", None)
+    res.pop("approx", None)
+    res.pop("exports", None)
+    for k in ("df", "chart_bytes", "resources", "result_digest", "error"):
+        res[k] = exact.get(k)
+
+
+def _render_export(res: dict, i: int, rid, suffix: str = ""):
+    """Descarga bajo demanda: el archivo se genera al pedirlo (o sale del cache por digest)."""
+    c1, c2 = st.columns([1, 2])
+    fmt = c1.selectbox("Formato", list(FORMATS), key=f"fmt_{rid}{suffix}",
+                       label_visibility="collapsed")
+    ready = res.setdefault("exports", {})
+    if fmt not in ready and c2.button("⬇️ Preparar descarga", key=f"prep_{rid}{suffix}"):
+        try:
+            # en modo cliente sólo tenemos el df recibido (no hay DB local)
+            ready[fmt] = str(export_df(res["df"], fmt, res.get("result_digest"))
+                             if os.getenv("AGENT_API_URL") else export_result(res, fmt))
+        except Exception as e:
+            st.error(f"No se pudo exportar: {e}")
+    if fmt in ready and os.path.exists(ready[fmt]):
+        with open(ready[fmt], "rb") as f:
+            c2.download_button(
+                f"Descargar {fmt}",
+                data=f.read(),
+                file_name=f"resultado_{i}{FORMATS[fmt][0]}",
+                mime=mime(fmt),
+                key=f"dl_{rid}{suffix}"
+            )
+
+
+def _render_data(slot, res: dict, i: int, rid, suffix: str = ""):
+    with slot.container():
+        approx = res.get("approx")
+        if approx:
+            st.warning(
+                f"⏳ Resultado **aproximado** sobre una muestra del "
+                f"{approx['sample_rate']:.0%} de `{approx['table']}` "
+                f"(SUM/COUNT escalados; columnas `_err` = ±IC 95%). "
+                + ("Cálculo exacto cancelado." if approx.get("exact_cancelled")
+                   else "Calculando el resultado exacto..."))
+        if res.get("error"):
+            st.error(f"Error: {res['error']}")
+            return
+
+        rs = res.get("resources") or {}
+        if rs.get("degraded"):
+            st.warning(f"Resultado grande ({rs['result_bytes'] / 1e6:.0f} MB): "
+                       "se muestra sólo una vista previa y sin gráfico.")
+        if rs:
+            steps = f" · {rs['vm_steps']:,} pasos VM" if rs.get("vm_steps") else ""
+            steps += " · desde cache" if rs.get("cache_hit") else ""
+            peak = f" · pico chart {rs['chart_peak_kb']:.0f} KB" if rs.get("chart_peak_kb") else ""
+            st.caption(f"⏱️ {rs.get('wall_ms', 0):.0f} ms ({rs.get('engine', '')}){steps} · "
+                       f"{rs.get('rows', 0):,} filas · {rs.get('result_bytes', 0) / 1024:.0f} KB"
+                       f"{peak}")
+
+        if res.get("df") is not None and not res["df"].empty:
+            st.dataframe(res["df"].head(50), key=f"df_{rid}{suffix}")
+            if not approx:  # el aproximado es transitorio: se exporta el exacto
+                _render_export(res, i, rid, suffix)
+
+        if res.get("chart_bytes"):
+            st.image(res["chart_bytes"],
+                     caption="Visualización sugerida", use_column_width=True)
+
+
+pending = []  # resultados aproximados esperando la versión exacta
 for i, res in enumerate(reversed(st.session_state["results"]), 1):
     rid = res.get("ts", i)  # key estable por si cambia el orden
 
@@ -336,7 +559,10 @@ for i, res in enumerate(reversed(st.session_state["results"]), 1):
             for a in ref["assumptions"]:
                 st.write(f"• {a}")
 
-        if "confidence" in ref:
+        if ref.get("skipped"):
+            st.caption("⚡ Refinamiento salteado: la pregunta ya era precisa "
+                       f"(puntaje local {float(ref['confidence']):.2f}).")
+        elif "confidence" in ref:
             st.caption(
                 f"Confianza del agente: {round(float(ref['confidence'])*100):d}%")
 
@@ -352,20 +578,40 @@ for i, res in enumerate(reversed(st.session_state["results"]), 1):
 
         st.write(res.get("plan", {}).get("explain", ""))
 
-        if res.get("df") is not None and not res["df"].empty:
-            st.dataframe(res["df"].head(50), key=f"df_{rid}")
-            csv_bytes = res["df"].to_csv(index=False).encode()
-            st.download_button(
-                "Descargar CSV",
-                data=csv_bytes,
-                file_name=f"resultado_{i}.csv",
-                mime="text/csv",
-                key=f"dl_{rid}"
-            )
+        # Si la versión exacta ya terminó (rerun posterior), la adoptamos
+        fut = res.get("exact_future")
+        if fut is not None and fut.done():
+            _adopt_exact(res)
 
-        if res.get("chart_bytes"):
-            st.image(res["chart_bytes"],
-                     caption="Visualización sugerida", use_column_width=True)
+        slot = st.empty()
+        _render_data(slot, res, i, rid)
+        if res.get("exact_future") is not None:
+            pending.append((slot, res, i, rid))
 
         with st.expander("Notas / supuestos", expanded=False):
             st.write(res.get("plan", {}).get("notes", ""))
+
+# Con todo renderizado, esperamos las versiones exactas y reemplazamos en el lugar.
+# El botón queda visible mientras alguna siga en curso; al cancelar se conserva
+# el aproximado.
+if pending:
+    status = st.empty()
+    if st.button("⛔ Cancelar resultado exacto", key="cancel_exact_btn"):
+        for slot, res, i, rid in pending:
+            cancel_query(res.pop("query_id", ""))
+            res.pop("exact_future", None)
+            res["approx"]["exact_cancelled"] = True
+            _render_data(slot, res, i, rid, suffix="_cancelled")
+        pending = []
+    t0 = time.time()
+    while pending:
+        # cada actualización de `status` es un punto donde Streamlit corta el
+        # run si el usuario tocó "Cancelar"
+        status.info(f"⏳ Calculando resultado exacto... {time.time() - t0:.0f}s")
+        for item in [it for it in pending if it[1]["exact_future"].done()]:
+            slot, res, i, rid = item
+            _adopt_exact(res)
+            _render_data(slot, res, i, rid, suffix="_exact")
+            pending.remove(item)
+        time.sleep(0.25)
+    status.empty()
@@ -0,0 +1,126 @@
+"""
+Warm-up de arranque: hace antes del primer pedido todo lo que hoy paga el
+primer usuario.
+
+1. db      → siembra / verifica la DB e instala el versionado de tablas
+2. schema  → introspección de esquema y FKs
+3. stats   → catálogo de estadísticas (lo usan el explorador y el planner)
+4. engine  → conexión del motor y workers del pool de consultas
+5. llm     → prompts y cliente (import de agent_core)
+6. chart   → cache de fuentes de matplotlib + un chart trivial
+7. hot     → caches de refinamiento / plan / resultado con las preguntas
+             exitosas más frecuentes del historial (.session), con contexto
+             de sesión vacío (el de una sesión nueva)
+
+Los caches en memoria sólo sirven en el mismo proceso: la UI lo corre en
+segundo plano al arrancar y service.py antes de escuchar. Como CLI deja listo
+lo que persiste en disco (DB, catálogo, copia DuckDB, fuentes) y mide cada paso.
+
+Uso:
+    python warmup.py --top 5
+"""
+import argparse
+import os
+import time
+
+WARMUP_TOP_K = int(os.getenv("WARMUP_TOP_K", "5"))
+
+
+def _step(report: list, name: str, fn, describe=str):
+    t0 = time.perf_counter()
+    try:
+        value = fn()
+        detail, ok = describe(value), True
+    except Exception as e:
+        value, detail, ok = None, f"{type(e).__name__}: {e}", False
+    report.append({"step": name, "ms": round((time.perf_counter() - t0) * 1000, 1),
+                   "ok": ok, "detail": detail})
+    return value
+
+
+def _warm_engine():
+    import query_pool
+    import tools_sql
+    eng = tools_sql.get_engine()
+    eng.tables()
+    if not query_pool.QUERY_POOL_WORKERS:
+        return f"{eng.name} (sin pool)"
+    pool = query_pool.get_pool()
+    # la cola de workers libres es FIFO: N consultas seguidas pasan por los N workers
+    for _ in range(query_pool.QUERY_POOL_WORKERS):
+        pool.run(eng.name, "SELECT 1")
+    return f"{eng.name} + {query_pool.QUERY_POOL_WORKERS} workers"
+
+
+def _warm_llm():
+    import agent_core
+    return ", ".join(f"{k}={v}" for k, v in agent_core.MODELS.items())
+
+
+def _warm_chart():
+    import pandas as pd
+    from matplotlib import font_manager
+    import agent_core
+    font_manager.findfont("DejaVu Sans")  # construye el cache de fuentes si falta
+    png = agent_core._render_chart(pd.DataFrame({"x": ["a", "b"], "y": [1, 2]}),
+                                   {"type": "bar"})
+    return f"{len(png or b'')} bytes"
+
+
+def _warm_hot(schema: dict, top_k: int):
+    import agent_core
+    import history_index
+    import tools_sql
+    entries = history_index.frequent_questions(top_k)
+    results = 0
+    for e in entries:
+        refinement, plan = e.get("refinement") or {}, e.get("plan") or {}
+        if e.get("question_original") and refinement and not refinement.get("skipped"):
+            refinement = {k: v for k, v in refinement.items() if k != "precision"}
+            agent_core.plan_cache_put("refine", e["question_original"], schema, refinement)
+        if plan.get("sql"):
+            agent_core.plan_cache_put("plan", e.get("question_refined") or e.get("question"),
+                                      schema, plan)
+            try:
+                empty = tools_sql.run_sql(plan["sql"]).empty
+            except Exception:
+                empty = True
+            if empty:  # mismo criterio que answer(): sin filas no se cachea
+                agent_core.forget_plan(e.get("question_refined") or e.get("question"))
+            else:
+                results += 1
+    return f"{len(entries)} preguntas, {results} resultados"
+
+
+def warmup(top_k: int = WARMUP_TOP_K) -> list[dict]:
+    """Corre los pasos en orden; devuelve [{step, ms, ok, detail}]. Nunca lanza."""
+    import tools_sql
+    report: list = []
+    _step(report, "db", lambda: (tools_sql.ensure_db(), tools_sql.ensure_change_tracking()),
+          lambda v: str(tools_sql.DB_PATH))
+    schema = _step(report, "schema", lambda: (tools_sql.get_schema(), tools_sql.get_foreign_keys()),
+                   lambda v: f"{len(v[0])} tablas, {len(v[1])} FKs")
+    _step(report, "stats", tools_sql.table_stats, lambda v: f"{len(v)} tablas")
+    _step(report, "engine", _warm_engine)
+    _step(report, "llm", _warm_llm)
+    _step(report, "chart", _warm_chart)
+    if schema and top_k:
+        _step(report, "hot", lambda: _warm_hot(schema[0], top_k))
+    return report
+
+
+def format_report(report: list[dict]) -> str:
+    total = sum(r["ms"] for r in report)
+    lines = [f"{'paso':<8} {'ms':>8}  detalle"]
+    lines += [f"{r['step']:<8} {r['ms']:>8.0f}  {'' if r['ok'] else '⚠️ '}{r['detail']}"
+              for r in report]
+    lines.append(f"{'total':<8} {total:>8.0f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Warm-up de arranque")
+    ap.add_argument("--top", type=int, default=WARMUP_TOP_K,
+                    help="preguntas frecuentes a precargar (0 = ninguna)")
+    args = ap.parse_args()
+    print(format_report(warmup(args.top)))